@@ -0,0 +1,5 @@
+import sys
+
+from b_cities.cli import main
+
+sys.exit(main())
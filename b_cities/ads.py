@@ -0,0 +1,276 @@
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from array import array
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from b_cities import perf
+
+# Local store of campaign/day cost rows, keyed by (customer_id, date)
+COST_CACHE_PATH = os.path.join(".cache", "kw_cost_cache.sqlite")
+
+# Google Ads keeps restating the last few days, so these are always refetched
+RESTATEMENT_DAYS = 3
+
+# Ads accounts pulled into the cost report
+CUSTOMER_IDS = ["9680382253", "4840834180"]
+
+# Shards are fetched on a bounded pool and retried with exponential backoff
+FETCH_WORKERS = 4
+FETCH_RETRIES = 3
+FETCH_BACKOFF_SECONDS = 1.0
+
+# gRPC statuses worth retrying; anything else (auth, a bad query, ...) fails on the first attempt
+RETRY_STATUS_CODES = {"UNAVAILABLE", "DEADLINE_EXCEEDED", "RESOURCE_EXHAUSTED", "INTERNAL", "ABORTED"}
+
+
+# Get dashboard data
+def get_kw_data(client, customer_id, start_date, end_date):
+    ga_service = client.get_service("GoogleAdsService", version="v17")
+
+    # Constructing the query
+    query = f"""
+    SELECT
+        campaign.name,
+        campaign.id,
+        segments.date,
+        metrics.cost_micros
+    FROM
+        campaign
+    WHERE
+        segments.date BETWEEN '{start_date}' AND '{end_date}'
+    """
+
+    response = ga_service.search_stream(customer_id=customer_id, query=query)
+    
+    # Append straight into column buffers instead of building a dict per row
+    dates = []
+    campaign_names = []
+    campaign_ids = array("q")
+    cost_micros = array("q")
+    for batch in response:
+        for row in batch.results:
+            dates.append(row.segments.date)
+            campaign_names.append(row.campaign.name)
+            campaign_ids.append(row.campaign.id)
+            cost_micros.append(row.metrics.cost_micros)
+
+    return _build_cost_frame(dates, campaign_names, campaign_ids, cost_micros)
+
+
+def _build_cost_frame(dates, campaign_names, campaign_ids, cost_micros):
+    # Dates and names repeat heavily, so parse / store each distinct value once
+    date_codes, unique_dates = pd.factorize(pd.Series(dates, dtype=object))
+    parsed_dates = pd.to_datetime(unique_dates, format="%Y-%m-%d")
+    return pd.DataFrame({
+        "Date": parsed_dates.take(date_codes),
+        "Campaign Name": pd.Categorical(campaign_names),
+        "Campaign ID": np.frombuffer(campaign_ids, dtype=np.int64) if len(campaign_ids) else np.array([], dtype=np.int64),
+        "Cost": np.frombuffer(cost_micros, dtype=np.int64) / 1e6 if len(cost_micros) else np.array([], dtype=np.float64),
+    })
+
+
+def _month_shards(start, end):
+    shards = []
+    shard_start = start
+    while shard_start <= end:
+        next_month = (shard_start.replace(day=1) + timedelta(days=32)).replace(day=1)
+        shard_end = min(end, next_month - timedelta(days=1))
+        shards.append((shard_start, shard_end))
+        shard_start = next_month
+    return shards
+
+
+def _transient(error):
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    # GoogleAdsException keeps the failed gRPC call on .error; grpc.RpcError is the call itself
+    call = getattr(error, "error", error)
+    code = getattr(call, "code", None)
+    if callable(code):
+        try:
+            code = code()
+        except Exception:
+            return False
+    return getattr(code, "name", None) in RETRY_STATUS_CODES
+
+
+def _fetch_shard(client, customer_id, shard_start, shard_end, retries, backoff):
+    for attempt in range(retries + 1):
+        try:
+            with perf.track("get_kw_data", customer_id=customer_id, start_date=shard_start.isoformat(),
+                            end_date=shard_end.isoformat(), attempt=attempt) as record:
+                df = get_kw_data(client, customer_id, shard_start.isoformat(), shard_end.isoformat())
+                record["rows_out"] = len(df)
+            return df
+        except Exception as e:
+            if attempt == retries or not _transient(e):
+                raise
+            time.sleep(backoff * 2 ** attempt)
+
+
+def _run_shards(client, jobs, max_workers, retries, backoff, on_result=None):
+    # jobs are (customer_id, shard_start, shard_end); results come back in job order. on_result(job, df) is
+    # called from this thread as each shard lands, so finished shards are kept even if another one fails;
+    # the first failure is raised once every shard is done.
+    if not jobs:
+        return []
+    results = [None] * len(jobs)
+    failures = []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(jobs))) as pool:
+        futures = {
+            perf.submit(pool, _fetch_shard, client, customer_id, shard_start, shard_end, retries, backoff): i
+            for i, (customer_id, shard_start, shard_end) in enumerate(jobs)
+        }
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                failures.append((i, e))
+                continue
+            if on_result is not None:
+                on_result(jobs[i], results[i])
+    if failures:
+        raise min(failures, key=lambda failure: failure[0])[1]
+    return results
+
+
+def fetch_kw_data(client, customer_ids, start_date, end_date, max_workers=FETCH_WORKERS,
+                  retries=FETCH_RETRIES, backoff=FETCH_BACKOFF_SECONDS):
+    shards = _month_shards(date.fromisoformat(start_date), date.fromisoformat(end_date))
+    jobs = [(customer_id, shard_start, shard_end) for customer_id in customer_ids for shard_start, shard_end in shards]
+    frames = _run_shards(client, jobs, max_workers, retries, backoff)
+    return _concat_cost_frames(frames)
+
+
+def _concat_cost_frames(frames):
+    if not frames:
+        return _build_cost_frame([], [], array("q"), array("q"))
+    df = pd.concat(frames, ignore_index=True)
+    # Shards carry their own name categories, so re-encode once after stacking
+    df["Campaign Name"] = df["Campaign Name"].astype("category")
+    return df
+
+
+def _open_cost_cache(cache_path):
+    cache_dir = os.path.dirname(cache_path)
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+
+    conn = sqlite3.connect(cache_path)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS cost_rows (
+            customer_id TEXT NOT NULL,
+            date TEXT NOT NULL,
+            campaign_id INTEGER,
+            campaign_name TEXT,
+            cost_micros INTEGER
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS cost_rows_key ON cost_rows (customer_id, date)")
+    # Dates that were fetched, even when the API returned no rows for them
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS fetched_dates (
+            customer_id TEXT NOT NULL,
+            date TEXT NOT NULL,
+            PRIMARY KEY (customer_id, date)
+        )
+    """)
+    return conn
+
+
+def _date_span(start, end):
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+def _missing_ranges(cached_dates, start, end, refetch_from):
+    # Collapse the uncached (or restatement window) dates into contiguous ranges
+    ranges = []
+    for day in _date_span(start, end):
+        if day.isoformat() in cached_dates and day < refetch_from:
+            continue
+        if ranges and ranges[-1][1] == day - timedelta(days=1):
+            ranges[-1][1] = day
+        else:
+            ranges.append([day, day])
+    return [(range_start, range_end) for range_start, range_end in ranges]
+
+
+def _store_cost_rows(conn, customer_id, range_start, range_end, df):
+    days = [day.isoformat() for day in _date_span(range_start, range_end)]
+    with conn:
+        conn.execute(
+            "DELETE FROM cost_rows WHERE customer_id = ? AND date BETWEEN ? AND ?",
+            (customer_id, days[0], days[-1]),
+        )
+        if not df.empty:
+            conn.executemany(
+                "INSERT INTO cost_rows VALUES (?, ?, ?, ?, ?)",
+                zip(
+                    [customer_id] * len(df),
+                    df["Date"].astype(str),
+                    df["Campaign ID"].astype("int64").tolist(),
+                    df["Campaign Name"].astype(str),
+                    (df["Cost"] * 1e6).round().astype("int64").tolist(),
+                ),
+            )
+        conn.executemany(
+            "INSERT OR REPLACE INTO fetched_dates VALUES (?, ?)",
+            [(customer_id, day) for day in days],
+        )
+
+
+def get_cached_kw_data(client, customer_ids, start_date, end_date, cache_path=COST_CACHE_PATH,
+                       restatement_days=RESTATEMENT_DAYS, today=None, max_workers=FETCH_WORKERS,
+                       retries=FETCH_RETRIES, backoff=FETCH_BACKOFF_SECONDS):
+    start = date.fromisoformat(start_date)
+    end = date.fromisoformat(end_date)
+    today = today or date.today()
+    refetch_from = today - timedelta(days=restatement_days)
+
+    conn = _open_cost_cache(cache_path)
+    try:
+        # Only hit the API for dates we have not stored yet, split into month shards
+        jobs = []
+        for customer_id in customer_ids:
+            cached_dates = {
+                row[0] for row in conn.execute(
+                    "SELECT date FROM fetched_dates WHERE customer_id = ? AND date BETWEEN ? AND ?",
+                    (customer_id, start_date, end_date),
+                )
+            }
+            for range_start, range_end in _missing_ranges(cached_dates, start, end, refetch_from):
+                for shard_start, shard_end in _month_shards(range_start, range_end):
+                    jobs.append((customer_id, shard_start, shard_end))
+
+        # Fetch concurrently, but write to SQLite from this thread only, one shard at a time as each lands
+        _run_shards(client, jobs, max_workers, retries, backoff,
+                    on_result=lambda job, df: _store_cost_rows(conn, *job, df))
+
+        frames = []
+        for customer_id in customer_ids:
+            rows = pd.read_sql_query(
+                """
+                SELECT date, campaign_name, campaign_id, cost_micros
+                FROM cost_rows
+                WHERE customer_id = ? AND date BETWEEN ? AND ?
+                ORDER BY date, campaign_id
+                """,
+                conn,
+                params=(customer_id, start_date, end_date),
+            )
+            frames.append(_build_cost_frame(
+                rows["date"].tolist(),
+                rows["campaign_name"].tolist(),
+                rows["campaign_id"].to_numpy(dtype=np.int64),
+                rows["cost_micros"].to_numpy(dtype=np.int64),
+            ))
+    finally:
+        conn.close()
+
+    return _concat_cost_frames(frames)
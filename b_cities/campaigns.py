@@ -0,0 +1,178 @@
+import hashlib
+import os
+import pickle
+import time
+
+import numpy as np
+import pandas as pd
+
+# Local copy of the Mapping_ref sheet, so cold starts do not need Sheets at all
+CAMPAIGNS_CACHE_PATH = os.path.join(".cache", "mapping_ref.pkl")
+
+# After this long the sheet's modified time is checked and the table re-downloaded if it changed
+CAMPAIGNS_TTL_SECONDS = 6 * 60 * 60
+
+# Loaded dimensions, kept across Streamlit reruns in this process
+_loaded = {}
+
+# Parsed campaign strings, kept across runs in this process; a table is rebuilt once it outgrows this
+PARSE_CACHE_ENTRIES = 100_000
+_parsed = {}
+
+
+def _parse_distinct(series, kind, parse):
+    # There are far fewer campaigns than rows: parse each distinct string once and broadcast it back.
+    # parse gets a Series of not-yet-seen values indexed by themselves; tables are per input dtype
+    # so the output dtype never depends on what was parsed earlier.
+    codes, uniques = pd.factorize(series, use_na_sentinel=False)
+    values = pd.Index(np.asarray(uniques, dtype=object))
+    key = (kind, str(series.dtype))
+    table = _parsed.get(key)
+    if table is None and not len(values):
+        # Nothing to parse and no table to take the shape from: parse nothing to get an empty result
+        return parse(pd.Series(values, index=values, dtype=object)).set_axis(series.index)
+    if table is not None and len(table) + len(values) > PARSE_CACHE_ENTRIES:
+        table = None
+
+    new = np.ones(len(values), dtype=bool) if table is None else ~values.isin(table.index)
+    if new.any():
+        parsed = parse(pd.Series(uniques, index=values)[new])
+        table = parsed if table is None else pd.concat([table, parsed])
+        _parsed[key] = table
+    return table.iloc[table.index.get_indexer(values)[codes]].set_axis(series.index)
+
+
+def _to_campaign_id(series):
+    # Anything that is not a plain integer ID can never match a campaign, so it becomes NA
+    return pd.to_numeric(series.str.strip(), errors="coerce").astype("Int64")
+
+
+def parse_campaign_id(series):
+    return _parse_distinct(series, "campaign_id", _to_campaign_id)
+
+
+def strip_campaigns(series):
+    return _parse_distinct(series, "strip", lambda values: values.str.strip())
+
+
+def _split_label(values):
+    return pd.DataFrame({
+        "Campaign": values.str.extract(r'^(.*?)(?=\()', expand=False).str.strip(),
+        "campaign_id": _to_campaign_id(values.str.extract(r'\((\d+)\)$', expand=False)),
+    })
+
+
+def parse_campaign_labels(series):
+    # "Name (123)" -> Campaign "Name" and campaign_id 123
+    return _parse_distinct(series, "label", _split_label)
+
+
+def _build_index(keys):
+    # Unique keys -> the (possibly several) dimension rows carrying them, grouped by key
+    codes, uniques = pd.factorize(keys)
+    order = np.argsort(codes, kind="stable")
+    counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]]) + np.count_nonzero(codes < 0)
+    return {"keys": pd.Index(uniques), "order": order, "starts": starts, "counts": counts}
+
+
+def build_campaigns(mapping_ref, fetched_at=None, modified=None):
+    frame = mapping_ref.copy()
+    frame["Campaign ID"] = frame["Campaign ID"].astype(str)
+    campaign_id = parse_campaign_id(frame["Campaign ID"])
+    return {
+        "frame": frame,
+        "campaign_id": campaign_id,
+        # Names are looked up trimmed; the frame keeps them as written in the sheet
+        "by_name": _build_index(strip_campaigns(frame["Campaign"])),
+        # Content hash, so downstream caches can tell Mapping_ref versions apart
+        "version": hashlib.sha1(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes()).hexdigest(),
+        "fetched_at": fetched_at if fetched_at is not None else time.time(),
+        "modified": modified,
+    }
+
+
+def match_campaigns(keys, campaigns):
+    # Same pairs as an inner merge against Mapping_ref on campaign names, ignoring leading and trailing
+    # whitespace on both sides: left order kept, duplicate matches adjacent.
+    # Keys repeat heavily, so each distinct key is looked up once
+    index = campaigns["by_name"]
+    codes, uniques = pd.factorize(strip_campaigns(keys), use_na_sentinel=False)
+    positions = index["keys"].get_indexer(pd.Index(uniques))[codes]
+    found = positions >= 0
+    row_counts = np.where(found, index["counts"][np.where(found, positions, 0)], 0)
+    rows = np.repeat(np.arange(len(positions)), row_counts)
+    offsets = np.arange(len(rows)) - np.repeat(np.cumsum(row_counts) - row_counts, row_counts)
+    matches = index["order"][np.repeat(index["starts"][np.where(found, positions, 0)], row_counts) + offsets]
+    return rows, matches
+
+
+def join_campaigns(frame, keys, campaigns):
+    rows, matches = match_campaigns(keys, campaigns)
+    left = frame.iloc[rows].reset_index(drop=True)
+    right = campaigns["frame"].iloc[matches].reset_index(drop=True)
+    return left, right
+
+
+def _save(campaigns, cache_path):
+    cache_dir = os.path.dirname(cache_path)
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+    payload = {key: campaigns[key] for key in ("frame", "fetched_at", "modified")}
+    pd.to_pickle(payload, cache_path + ".tmp")
+    os.replace(cache_path + ".tmp", cache_path)
+
+
+def _load_saved(cache_path):
+    try:
+        payload = pd.read_pickle(cache_path)
+    except (OSError, EOFError, ValueError, KeyError, pickle.UnpicklingError):
+        return None
+    return build_campaigns(payload["frame"], payload["fetched_at"], payload["modified"])
+
+
+def _modified(last_modified):
+    # The stamp is only an optimisation: if it cannot be fetched it is unknown, and the table is re-downloaded
+    if last_modified is None:
+        return None
+    try:
+        return last_modified()
+    except Exception:
+        return None
+
+
+def load_campaigns(fetch, last_modified=None, ttl=CAMPAIGNS_TTL_SECONDS, refresh=False,
+                   cache_path=CAMPAIGNS_CACHE_PATH, now=None):
+    # fetch() downloads Mapping_ref as a DataFrame (None on failure; an error is only raised with no copy to serve);
+    # last_modified(), if given, returns a cheap version stamp of the sheet, like an ETag (errors count as unknown)
+    now = now if now is not None else time.time()
+    campaigns = _loaded.get(cache_path) or _load_saved(cache_path)
+
+    if campaigns is not None and not refresh:
+        if now - campaigns["fetched_at"] < ttl:
+            _loaded[cache_path] = campaigns
+            return campaigns
+        modified = _modified(last_modified)
+        if modified is not None and modified == campaigns["modified"]:
+            # Unchanged since the last download: just restart the TTL
+            campaigns["fetched_at"] = now
+            _save(campaigns, cache_path)
+            _loaded[cache_path] = campaigns
+            return campaigns
+    else:
+        modified = _modified(last_modified)
+
+    try:
+        mapping_ref = fetch()
+    except Exception:
+        if campaigns is None:
+            raise
+        mapping_ref = None
+    if mapping_ref is None:
+        # Sheets unavailable: a stale table beats no table
+        return campaigns
+
+    campaigns = build_campaigns(mapping_ref, now, modified)
+    _save(campaigns, cache_path)
+    _loaded[cache_path] = campaigns
+    return campaigns
@@ -0,0 +1,96 @@
+import argparse
+import json
+import os
+import time
+
+from b_cities import perf
+from b_cities.metacards import CHUNK_ROWS, ENGINES, METACARD_ENGINE
+from b_cities.pipeline import publish, run, write_outputs
+
+
+def _ads_client(config_path):
+    from google.ads.googleads.client import GoogleAdsClient
+
+    return GoogleAdsClient.load_from_storage(config_path)
+
+
+def _session_getter(service_account_path):
+    session = None
+
+    def get_session():
+        nonlocal session
+        if session is None:
+            from b_cities.sheets import SheetsSession
+
+            with open(service_account_path) as f:
+                session = SheetsSession.from_service_account(json.load(f))
+        return session
+
+    return get_session
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m b_cities", description="Run the bottom-cities pipeline without Streamlit.")
+    parser.add_argument("--start-date", required=True, help="YYYY-MM-DD")
+    parser.add_argument("--end-date", required=True, help="YYYY-MM-DD")
+    parser.add_argument("--metacard-2w-spot", required=True, help="2W and Spot metacard CSV")
+    parser.add_argument("--metacard-uac", required=True, help="UAC metacard CSV")
+    parser.add_argument("--metacard-uace", required=True, help="UACE metacard CSV")
+    parser.add_argument("--out-dir", default="output")
+    parser.add_argument("--format", dest="output_format", choices=["csv", "parquet"], default="csv")
+    parser.add_argument("--ads-config", default="google-ads.yaml", help="google-ads.yaml for GoogleAdsClient")
+    parser.add_argument("--service-account", default="service_account.json", help="Google service account JSON")
+    parser.add_argument("--refresh-mapping", action="store_true", help="re-download Mapping_ref even if cached")
+    parser.add_argument("--publish", action="store_true", help="also update the output worksheets")
+    parser.add_argument("--chunksize", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--engine", choices=ENGINES, default=METACARD_ENGINE,
+                        help="duckdb aggregates out of core, for metacards too large for memory")
+    parser.add_argument("--rollup-dir", help="keep the report in a daily rollup store here and only build new days")
+    parser.add_argument("--perf-log", action="store_true", help="log every stage as a JSON line on stderr")
+    parser.add_argument("--profile", choices=perf.PROFILERS, help="profile the run into OUT_DIR/profile.txt")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    get_session = _session_getter(args.service_account)
+    if args.perf_log:
+        perf.enable_logging()
+    records = perf.begin()
+    profiler = perf.start_profiler(args.profile) if args.profile else None
+
+    start = time.perf_counter()
+    outputs = run(
+        _ads_client(args.ads_config),
+        get_session,
+        args.start_date,
+        args.end_date,
+        args.metacard_2w_spot,
+        args.metacard_uac,
+        args.metacard_uace,
+        refresh_mapping=args.refresh_mapping,
+        chunksize=args.chunksize,
+        engine=args.engine,
+        rollup_dir=args.rollup_dir,
+    )
+    for name, path in write_outputs(outputs, args.out_dir, args.output_format).items():
+        print(f"{name}: {len(outputs[name])} rows -> {path}")
+
+    failed = False
+    if args.publish:
+        for name, status in publish(get_session(), outputs).items():
+            if status["status"] == "ok":
+                print(f"{name}: {status['changed_rows']} rows changed in Google Sheets ({status['seconds']:.1f}s)")
+            else:
+                print(f"{name}: not published: {status['error']}")
+                failed = True
+
+    # Stage timings always land next to the outputs
+    with open(os.path.join(args.out_dir, "perf.json"), "w") as f:
+        json.dump(records, f, indent=2, default=str)
+    if profiler is not None:
+        with open(os.path.join(args.out_dir, "profile.txt"), "w") as f:
+            f.write(perf.stop_profiler(profiler))
+
+    print(f"done in {time.perf_counter() - start:.1f}s")
+    return 1 if failed else 0
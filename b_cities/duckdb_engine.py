@@ -0,0 +1,123 @@
+import os
+
+import duckdb
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+
+from b_cities.metacards import CLASS_NAMES, FREQUENCY_CLASSES, _flag_table, _measures
+
+# DuckDB works within this much memory and spills larger aggregations to TEMP_DIR
+MEMORY_LIMIT = "512MB"
+TEMP_DIR = ".cache/duckdb"
+THREADS = 2
+
+# Bytes of CSV parsed per Arrow record batch
+CSV_BLOCK_BYTES = 8 << 20
+
+# read_csv's default missing-value markers, so both engines see the same NULLs
+NA_VALUES = [
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+]
+
+# pandas dtype -> SQL type the column is cast to; anything else stays VARCHAR
+SQL_TYPES = {"Int8": "TINYINT", "Int32": "INTEGER"}
+
+
+def _quoted(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _literal(value):
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    return str(int(value))
+
+
+def _class_case(column, lookup, classes):
+    # Mirrors metacards._class_codes: missing and unknown values fall in class 0
+    class_index = {name: i for i, name in enumerate(classes)}
+    whens = [
+        f"WHEN {_literal(value)} THEN {class_index[name]}"
+        for value, name in lookup.items()
+        if value is not None and class_index.get(name, 0)
+    ]
+    if not whens:
+        return "0"
+    return f"CASE {_quoted(column)} {' '.join(whens)} ELSE 0 END"
+
+
+def _query(spec):
+    casts = ", ".join(
+        f"CAST({_quoted(column)} AS {SQL_TYPES[dtype]}) AS {_quoted(column)}" if dtype in SQL_TYPES else _quoted(column)
+        for column, dtype in spec["dtypes"].items()
+    )
+    vehicle_column, vehicle_lookup = spec["vehicle"]
+    combined = (
+        f"({_class_case(spec['frequency'], FREQUENCY_CLASSES, CLASS_NAMES['frequency'])}) * {len(CLASS_NAMES['vehicle'])}"
+        f" + ({_class_case(vehicle_column, vehicle_lookup, CLASS_NAMES['vehicle'])})"
+    )
+    where = " AND ".join(f"{_quoted(column)} = {_literal(value)}" for column, value in (spec["keep"] or {}).items())
+
+    # Same columns, in the same order, as the pandas engine's fine table
+    table = _flag_table(spec["flags"])
+    measures = [f"COUNT(*) AS {_quoted(spec['count'])}"] if spec["count"] else []
+    measures += [
+        f"COUNT(*) FILTER (WHERE combined IN ({', '.join(map(str, np.flatnonzero(table[:, i])))})) AS {_quoted(flag)}"
+        for i, flag in enumerate(spec["flags"])
+    ]
+    measures += [f"CAST(COALESCE(SUM({_quoted(column)}), 0) AS BIGINT) AS {_quoted(column)}" for column in spec["sums"]]
+    keys = ", ".join(map(_quoted, spec["group_by"]))
+
+    return (
+        f"WITH typed AS (SELECT {casts} FROM raw{f' WHERE {where}' if where else ''}),"
+        f" coded AS (SELECT *, {combined} AS combined FROM typed)"
+        f" SELECT {keys}, {', '.join(measures)} FROM coded GROUP BY {keys}"
+    )
+
+
+def _open_csv(file, columns):
+    # Streamlit uploads may already have been read once
+    if hasattr(file, "seek"):
+        file.seek(0)
+    return pacsv.open_csv(
+        file,
+        read_options=pacsv.ReadOptions(block_size=CSV_BLOCK_BYTES),
+        convert_options=pacsv.ConvertOptions(
+            include_columns=columns,
+            column_types={column: pa.string() for column in columns},
+            null_values=NA_VALUES,
+            strings_can_be_null=True,
+        ),
+    )
+
+
+def _connect():
+    os.makedirs(TEMP_DIR, exist_ok=True)
+    con = duckdb.connect()
+    con.execute(f"SET memory_limit = '{MEMORY_LIMIT}'")
+    con.execute(f"SET temp_directory = '{TEMP_DIR}'")
+    con.execute(f"SET threads = {THREADS}")
+    con.execute("SET enable_progress_bar = false")
+    # Group order is irrelevant downstream, and not preserving it lets DuckDB stream the scan
+    con.execute("SET preserve_insertion_order = false")
+    return con
+
+
+def aggregate_file(file, spec):
+    # Returns the same fine table as the pandas engine: group_by keys with read_csv's dtypes, then int64 measures
+    con = _connect()
+    try:
+        con.register("raw", _open_csv(file, list(spec["dtypes"])))
+        fine = con.execute(_query(spec)).df()
+    finally:
+        con.close()
+
+    # Series() rather than astype() keeps missing string keys missing instead of turning them into "None"
+    for key in spec["group_by"]:
+        fine[key] = pd.Series(fine[key].to_numpy(dtype=object), dtype=spec["dtypes"][key])
+    measures = _measures(spec)
+    fine[measures] = fine[measures].astype("int64")
+    return fine
@@ -0,0 +1,72 @@
+import hashlib
+import sys
+from collections import OrderedDict
+
+import pandas as pd
+
+# Stage results kept per Streamlit session; least recently used entries go first
+STAGE_CACHE_BYTES = 1024 * 2**20
+STAGE_CACHE_ENTRIES = 32
+
+_HASH_CHUNK = 8 * 2**20
+
+
+def file_digest(file, digests=None):
+    # Content hash of an uploaded file (or path); digests, if given, remembers it per upload id
+    file_id = getattr(file, "file_id", None)
+    if digests is not None and file_id is not None and file_id in digests:
+        return digests[file_id]
+
+    h = hashlib.blake2b(digest_size=16)
+    if hasattr(file, "getbuffer"):
+        with file.getbuffer() as view:
+            for start in range(0, len(view), _HASH_CHUNK):
+                h.update(view[start:start + _HASH_CHUNK])
+    else:
+        with open(file, "rb") as f:
+            for block in iter(lambda: f.read(_HASH_CHUNK), b""):
+                h.update(block)
+    digest = h.hexdigest()
+
+    if digests is not None and file_id is not None:
+        digests[file_id] = digest
+    return digest
+
+
+def stage_key(stage, *inputs):
+    h = hashlib.blake2b(digest_size=16)
+    for part in inputs:
+        h.update(repr(part).encode())
+        h.update(b"\0")
+    return f"{stage}:{h.hexdigest()}"
+
+
+def _size(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, dict):
+        return sum(_size(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(_size(item) for item in value)
+    return sys.getsizeof(value)
+
+
+def new_stage_cache():
+    return OrderedDict()
+
+
+def memoize(cache, key, compute, max_bytes=STAGE_CACHE_BYTES, max_entries=STAGE_CACHE_ENTRIES):
+    # cache maps key -> (value, size); hits move to the end, evictions come off the front
+    if key in cache:
+        cache.move_to_end(key)
+        return cache[key][0]
+
+    value = compute()
+    cache[key] = (value, _size(value))
+    total = sum(size for _, size in cache.values())
+    while len(cache) > 1 and (len(cache) > max_entries or total > max_bytes):
+        _, (_, size) = cache.popitem(last=False)
+        total -= size
+    return value
@@ -0,0 +1,374 @@
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from b_cities import perf
+from b_cities.campaigns import match_campaigns, parse_campaign_id, parse_campaign_labels
+
+# Metacards are streamed in chunks of this many rows and aggregated as they arrive
+CHUNK_ROWS = 500_000
+
+# Chunk aggregates are folded into the running total after this many chunks, which bounds the memory they hold
+COMBINE_EVERY = 4
+
+# "pandas" aggregates chunks in process; "duckdb" runs the same aggregation as SQL and can spill to disk
+ENGINES = ("pandas", "duckdb")
+METACARD_ENGINE = "pandas"
+
+# Geo and vehicle dimensions live in a versioned file, so new cities and vehicle IDs need no code change
+DIMENSIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dimensions.json")
+
+
+def _dimension(raw):
+    # ID -> label as an array of category codes (-1 for unknown IDs), so mapping IDs is a single take.
+    # Categories are sorted so a categorical orders exactly like the labels themselves.
+    labels = {int(key): label for key, label in raw["values"].items()}
+    categories = sorted(set(labels.values()) | ({raw["missing"]} if raw.get("missing") else set()))
+    codes = np.full(max(labels) + 1, -1, dtype=np.int16)
+    for key, label in labels.items():
+        codes[key] = categories.index(label)
+    missing = categories.index(raw["missing"]) if raw.get("missing") else -1
+    return {"labels": labels, "categories": pd.Index(categories), "codes": codes, "missing": missing}
+
+
+def load_dimensions(path=DIMENSIONS_PATH):
+    with open(path) as f:
+        raw = json.load(f)
+    return {"version": raw["version"], "city": _dimension(raw["city"]), "vehicle": _dimension(raw["vehicle"])}
+
+
+DIMENSIONS = load_dimensions()
+
+# Only the columns each pipeline uses are read, with compact dtypes.
+# CUSTOMER_ID / MOBILE_NUMBER are only ever counted after a fillna, so row counts stand in for them.
+METACARD_2W_SPOT_DTYPES = {
+    "UTM_CAMPAIGN": str,
+    "LEAD_DATE": str,
+    "CAMPAIGN_NAME": str,
+    "CUSTOMER": "Int8",
+    "FREQUENCY_ENUM": "Int8",
+    "FIRST_CATEGORY": "category",
+    "REG_GEO_ID": "Int32",
+    "ACQ_2W": "Int32",
+    "ACQ_TRUCKS": "Int32",
+    "ACQ_HCV": "Int32",
+    "ACQ_LCV": "Int32",
+    "PNM_CONV": "Int32",
+}
+
+METACARD_UACE_DTYPES = {
+    "VEHICLE_ID": "Int32",
+    "FREQ": "Int8",
+    "GEO_REGION_ID": "Int32",
+    "CAMPAIGN_NAME": str,
+    "ORDER_DATE": str,
+}
+
+METACARD_UAC_DTYPES = {
+    "VEHICLE_TYPE": "category",
+    "FREQ": "Int8",
+    "GEO_REGION_ID": "Int32",
+    "CAMPAIGN_NAME": str,
+    "REG_DATE_FORMATED": str,
+}
+
+# Key-level aggregates are indexed by (campaign ID, date) as native Int64 / datetime64 values
+JOIN_KEYS = ["campaign_id", "date"]
+
+# Every flag column is a rule over a frequency class and a vehicle class
+FREQUENCY_CLASSES = {4: "SME", 5: "Retail", 6: "Retail"}
+CLASS_NAMES = {
+    "frequency": ["other", "SME", "Retail"],
+    "vehicle": ["other", "2W", "LCV", "HCV"],
+}
+
+# flag: (frequency classes, vehicle classes); None matches any class
+FLAG_RULES = {
+    "2W": (None, {"2W"}),
+    "LCV": (None, {"LCV"}),
+    "HCV": (None, {"HCV"}),
+    "Trucks": (None, {"LCV", "HCV"}),
+    "Total": (None, {"2W", "LCV", "HCV"}),
+    "SME": ({"SME"}, None),
+    "Retail": ({"Retail"}, None),
+    "SME_2W": ({"SME"}, {"2W"}),
+    "SME_Trucks": ({"SME"}, {"LCV", "HCV"}),
+}
+
+
+def _take_ids(series, table, missing):
+    # Integer IDs index straight into table; missing and out-of-range IDs take the value `missing`
+    positions = series.to_numpy(dtype=np.int64, na_value=-1)
+    table = np.append(table, missing)
+    return table[np.where((positions >= 0) & (positions < len(table) - 1), positions, -1)]
+
+
+def map_cities(ids, missing_as=None):
+    # Missing IDs get the dimension's missing label (Others), or are looked up as the ID missing_as
+    city = DIMENSIONS["city"]
+    if missing_as is not None:
+        ids = ids.fillna(missing_as)
+    codes = _take_ids(ids, city["codes"], -1)
+    if missing_as is None:
+        codes[ids.isna().to_numpy()] = city["missing"]
+    return pd.Series(pd.Categorical.from_codes(codes, city["categories"]), index=ids.index)
+
+
+def _derive_2w_spot(fine, campaigns):
+    fine["LEAD_DATE"] = parse_date(fine["LEAD_DATE"].str.strip())
+    fine["campaign_id"] = parse_campaign_id(fine["UTM_CAMPAIGN"])
+    fine["date"] = fine["LEAD_DATE"]
+    fine["City"] = map_cities(fine["REG_GEO_ID"])
+    return fine
+
+
+def _derive_uace(fine, campaigns):
+    # unknown regions were zero-filled before the city lookup, so they land outside every city
+    fine["City"] = map_cities(fine["GEO_REGION_ID"], missing_as=0)
+    labels = parse_campaign_labels(fine["CAMPAIGN_NAME"])
+    fine["Campaign"] = labels["Campaign"]
+    fine["campaign_id"] = labels["campaign_id"]
+    fine["date"] = parse_date(fine["ORDER_DATE"])
+    return fine
+
+
+def _derive_uac(fine, campaigns):
+    # look up Mapping_ref by campaign name and keep only UAC_ROI_tCPA campaigns
+    rows, matches = match_campaigns(fine["CAMPAIGN_NAME"], campaigns)
+    fine = fine.iloc[rows].reset_index(drop=True)
+    fine["Campaign"] = campaigns["frame"]["Campaign"].to_numpy()[matches]
+    fine["campaign_id"] = campaigns["campaign_id"].iloc[matches].reset_index(drop=True)
+    is_uac = campaigns["frame"]["Campaign"].str.contains("UAC_ROI_tCPA", na=False).to_numpy()
+    fine = fine[is_uac[matches]].copy()
+    fine["City"] = map_cities(fine["GEO_REGION_ID"], missing_as=0)
+    fine["date"] = parse_date(fine["REG_DATE_FORMATED"])
+    return fine
+
+
+# One entry per metacard: how to read and filter it, which flags it carries and how it is grouped.
+# Raw rows are grouped once by "group_by"; "derive" then adds the geo and join keys to that much
+# smaller table, which works because every derived key is a function of the group_by columns.
+# "keep" maps column -> value for rows to keep, if any; "flags" maps output column -> FLAG_RULES name;
+# "count" is a row count column, if any;
+# "uses_campaigns" marks sources whose output depends on Mapping_ref.
+METACARD_SPECS = {
+    "2w_spot": {
+        "dtypes": METACARD_2W_SPOT_DTYPES,
+        # keep only those rows where CUSTOMER = 1
+        "keep": {"CUSTOMER": 1},
+        "uses_campaigns": False,
+        "group_by": ["LEAD_DATE", "UTM_CAMPAIGN", "CAMPAIGN_NAME", "REG_GEO_ID"],
+        "derive": _derive_2w_spot,
+        "frequency": "FREQUENCY_ENUM",
+        "vehicle": ("FIRST_CATEGORY", {"2w": "2W", "LCV": "LCV", "HCV": "HCV"}),
+        "flags": {"SME": "SME", "Retail": "Retail", "SME_2W": "SME_2W", "SME_Trucks": "SME_Trucks"},
+        "sums": ["CUSTOMER", "ACQ_2W", "ACQ_TRUCKS", "ACQ_HCV", "ACQ_LCV", "PNM_CONV"],
+        "count": None,
+        "geo_keys": ["LEAD_DATE", "CAMPAIGN_NAME", "City"],
+        "geo_columns": ["LEAD_DATE", "City", "CAMPAIGN_NAME", "CUSTOMER", "ACQ_2W", "ACQ_TRUCKS", "ACQ_HCV", "ACQ_LCV", "PNM_CONV", "SME", "Retail", "SME_2W", "SME_Trucks"],
+        # the sheet has always been ordered by the dd-mm-YYYY text of LEAD_DATE
+        "geo_date_columns": ["LEAD_DATE"],
+        "key_columns": ["ACQ_2W", "ACQ_TRUCKS", "ACQ_HCV", "ACQ_LCV", "PNM_CONV", "SME", "Retail", "SME_2W", "SME_Trucks"],
+    },
+    "uace": {
+        "dtypes": METACARD_UACE_DTYPES,
+        "keep": None,
+        "uses_campaigns": False,
+        "group_by": ["ORDER_DATE", "CAMPAIGN_NAME", "GEO_REGION_ID"],
+        "derive": _derive_uace,
+        "frequency": "FREQ",
+        "vehicle": ("VEHICLE_ID", DIMENSIONS["vehicle"]["labels"]),
+        "flags": {
+            "2W_UACe": "2W", "LCV_UACe": "LCV", "HCV_UACe": "HCV", "Trucks_UACe": "Trucks", "Total_UACe": "Total",
+            "SME_UACe": "SME", "Retail_UACe": "Retail", "SME_2W_UACe": "SME_2W", "SME_Trucks_UACe": "SME_Trucks",
+        },
+        "sums": [],
+        "count": "CUSTOMER_ID",
+        "geo_keys": ["ORDER_DATE", "Campaign", "City"],
+        "geo_columns": ["ORDER_DATE", "City", "Campaign", "CUSTOMER_ID", "2W_UACe", "LCV_UACe", "HCV_UACe", "Trucks_UACe", "Total_UACe", "SME_UACe", "Retail_UACe", "SME_2W_UACe", "SME_Trucks_UACe"],
+        "geo_date_columns": [],
+        "key_columns": ["2W_UACe", "LCV_UACe", "HCV_UACe", "Trucks_UACe", "Total_UACe", "SME_UACe", "Retail_UACe", "SME_2W_UACe", "SME_Trucks_UACe"],
+    },
+    "uac": {
+        "dtypes": METACARD_UAC_DTYPES,
+        "keep": None,
+        "uses_campaigns": True,
+        "group_by": ["REG_DATE_FORMATED", "CAMPAIGN_NAME", "GEO_REGION_ID"],
+        "derive": _derive_uac,
+        "frequency": "FREQ",
+        "vehicle": ("VEHICLE_TYPE", {"2W": "2W", "LCV": "LCV", "HCV": "HCV"}),
+        "flags": {
+            "2W_UAC": "2W", "LCV_UAC": "LCV", "HCV_UAC": "HCV", "Trucks_UAC": "Trucks", "Total_UAC": "Total",
+            "SME_UAC": "SME", "Retail_UAC": "Retail", "SME_2W_UAC": "SME_2W", "SME_Trucks_UAC": "SME_Trucks",
+        },
+        "sums": [],
+        "count": "MOBILE_NUMBER",
+        "geo_keys": ["REG_DATE_FORMATED", "Campaign", "City"],
+        "geo_columns": ["REG_DATE_FORMATED", "City", "Campaign", "MOBILE_NUMBER", "2W_UAC", "LCV_UAC", "HCV_UAC", "Trucks_UAC", "Total_UAC", "SME_UAC", "Retail_UAC", "SME_2W_UAC", "SME_Trucks_UAC"],
+        "geo_date_columns": [],
+        "key_columns": ["2W_UAC", "LCV_UAC", "HCV_UAC", "Trucks_UAC", "Total_UAC", "SME_UAC", "Retail_UAC", "SME_2W_UAC", "SME_Trucks_UAC"],
+    },
+}
+
+
+def _read_chunks(file, dtypes, chunksize):
+    # Streamlit uploads may already have been read once
+    if hasattr(file, "seek"):
+        file.seek(0)
+    return pd.read_csv(file, usecols=list(dtypes), dtype=dtypes, chunksize=chunksize)
+
+
+def _keep_rows(chunk, keep):
+    mask = np.ones(len(chunk), dtype=bool)
+    for column, value in keep.items():
+        mask &= chunk[column].eq(value).to_numpy(dtype=bool, na_value=False)
+    return chunk[mask]
+
+
+def _class_codes(series, lookup, classes):
+    # Missing and unknown values fall in class 0
+    class_index = {name: i for i, name in enumerate(classes)}
+    if pd.api.types.is_integer_dtype(series.dtype):
+        # Integer IDs: one take into a class table indexed by ID
+        table = np.zeros(max(lookup) + 1, dtype=np.int8)
+        for value, name in lookup.items():
+            table[value] = class_index.get(name, 0)
+        return _take_ids(series, table, 0)
+
+    # Anything else: look up each distinct value once
+    codes, uniques = pd.factorize(series)
+    table = np.array([class_index.get(lookup.get(value), 0) for value in uniques] + [0], dtype=np.int8)
+    return table[codes]
+
+
+def _flag_table(flags):
+    # Row (frequency class * n_vehicle_classes + vehicle class) holds every flag value for that combination
+    frequency_classes = CLASS_NAMES["frequency"]
+    vehicle_classes = CLASS_NAMES["vehicle"]
+    table = np.zeros((len(frequency_classes) * len(vehicle_classes), len(flags)), dtype=np.int8)
+    for f, frequency_class in enumerate(frequency_classes):
+        for v, vehicle_class in enumerate(vehicle_classes):
+            for i, rule in enumerate(flags.values()):
+                frequencies, vehicles = FLAG_RULES[rule]
+                table[f * len(vehicle_classes) + v, i] = (
+                    (frequencies is None or frequency_class in frequencies)
+                    and (vehicles is None or vehicle_class in vehicles)
+                )
+    return table
+
+
+def _compute_flags(chunk, spec, table):
+    # One fused pass: two small integer codes per row, then a single take into the flag table
+    vehicle_column, vehicle_lookup = spec["vehicle"]
+    frequency = _class_codes(chunk[spec["frequency"]], FREQUENCY_CLASSES, CLASS_NAMES["frequency"])
+    vehicle = _class_codes(chunk[vehicle_column], vehicle_lookup, CLASS_NAMES["vehicle"])
+    combined = frequency * len(CLASS_NAMES["vehicle"]) + vehicle
+    return pd.DataFrame(table[combined], columns=list(spec["flags"]), index=chunk.index)
+
+
+def _measures(spec):
+    return ([spec["count"]] if spec["count"] else []) + spec["sums"] + list(spec["flags"])
+
+
+def _aggregate_chunk(chunk, spec, table):
+    values = _compute_flags(chunk, spec, table)
+    for column in spec["sums"]:
+        values[column] = chunk[column]
+
+    # Missing keys are kept because the geo and key-level outputs drop different rows
+    grouped = values.groupby([chunk[key] for key in spec["group_by"]], sort=False, dropna=False)
+    fine = grouped.sum()
+    if spec["count"]:
+        fine.insert(0, spec["count"], grouped.size())
+    return fine
+
+
+def _combine(partials, spec):
+    # Sums and counts are additive, so chunk aggregates can be re-grouped into the final one
+    if not partials:
+        return pd.DataFrame(columns=spec["group_by"] + _measures(spec)).set_index(spec["group_by"])
+    return pd.concat(partials).groupby(level=spec["group_by"], sort=False, dropna=False).sum().astype("int64")
+
+
+def _plain_labels(frame):
+    # Dimension columns are categorical while aggregating; outputs get plain labels back
+    for column in frame.columns[frame.dtypes.map(lambda dtype: isinstance(dtype, pd.CategoricalDtype))]:
+        frame[column] = frame[column].astype(frame[column].cat.categories.dtype)
+    return frame
+
+
+def _roll_up(fine, spec):
+    # Both outputs are small roll-ups of the fine table; here rows with missing keys drop out
+    geo = _plain_labels(fine.groupby(spec["geo_keys"], observed=True)[_measures(spec)].sum().reset_index())
+    for column in spec["geo_date_columns"]:
+        geo[column] = format_date(geo[column])
+    if spec["geo_date_columns"]:
+        geo = geo.sort_values(spec["geo_keys"], ignore_index=True)
+
+    by_key = fine.groupby(JOIN_KEYS)[spec["key_columns"]].sum()
+    return geo[spec["geo_columns"]], by_key
+
+
+def parse_date(series):
+    return pd.to_datetime(series, format="%d-%m-%Y")
+
+
+def format_date(series):
+    # Format each distinct date once and broadcast back to the rows
+    codes, uniques = pd.factorize(series)
+    formatted = np.append(pd.DatetimeIndex(uniques).strftime("%d-%m-%Y").to_numpy(dtype=object), np.nan)
+    return pd.Series(formatted[codes], index=series.index)
+
+
+def _aggregate_file(file, spec, chunksize, record):
+    # record gets the raw row count and the share of the time spent parsing CSV
+    table = _flag_table(spec["flags"])
+    partials = []
+    record["rows_in"], record["read_seconds"] = 0, 0.0
+    start = time.perf_counter()
+    for chunk in _read_chunks(file, spec["dtypes"], chunksize):
+        record["read_seconds"] += time.perf_counter() - start
+        record["rows_in"] += len(chunk)
+        if spec["keep"]:
+            chunk = _keep_rows(chunk, spec["keep"])
+        partials.append(_aggregate_chunk(chunk, spec, table))
+        if len(partials) > COMBINE_EVERY:
+            partials = [_combine(partials, spec)]
+        start = time.perf_counter()
+    record["read_seconds"] = round(record["read_seconds"] + time.perf_counter() - start, 4)
+    return _combine(partials, spec).reset_index()
+
+
+def ingest_metacard(file, spec, campaigns=None, chunksize=CHUNK_ROWS, engine=METACARD_ENGINE):
+    # Raw rows are aggregated exactly once; keys and both outputs are derived from that table.
+    # Only this step touches raw rows, so it is the only one the engines implement separately.
+    with perf.track("aggregate", engine=engine) as record:
+        if engine == "duckdb":
+            from b_cities.duckdb_engine import aggregate_file
+
+            fine = aggregate_file(file, spec)
+        elif engine == "pandas":
+            fine = _aggregate_file(file, spec, chunksize, record)
+        else:
+            raise ValueError(f"unknown metacard engine {engine!r}, expected one of {ENGINES}")
+        record["rows_out"] = len(fine)
+
+    with perf.track("derive_roll_up", rows_in=len(fine)) as record:
+        geo, by_key = _roll_up(spec["derive"](fine, campaigns), spec)
+        record["rows_out"] = len(geo)
+    return geo, by_key
+
+
+def ingest_2w_spot(file, chunksize=CHUNK_ROWS, engine=METACARD_ENGINE):
+    return ingest_metacard(file, METACARD_SPECS["2w_spot"], chunksize=chunksize, engine=engine)
+
+
+def ingest_uace(file, chunksize=CHUNK_ROWS, engine=METACARD_ENGINE):
+    return ingest_metacard(file, METACARD_SPECS["uace"], chunksize=chunksize, engine=engine)
+
+
+def ingest_uac(file, campaigns, chunksize=CHUNK_ROWS, engine=METACARD_ENGINE):
+    return ingest_metacard(file, METACARD_SPECS["uac"], campaigns=campaigns, chunksize=chunksize, engine=engine)
@@ -0,0 +1,101 @@
+import contextvars
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import resource
+import sys
+import time
+from contextlib import contextmanager
+
+# One JSON object per stage; nothing is printed unless a handler is attached (see enable_logging)
+logger = logging.getLogger("b_cities.perf")
+
+# Records of the run being collected, and the stage currently open, for this thread / task
+_records = contextvars.ContextVar("perf_records", default=None)
+_stage = contextvars.ContextVar("perf_stage", default=None)
+
+PROFILERS = ("cprofile", "pyinstrument")
+
+
+def rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, AttributeError, ValueError):
+        # No /proc (macOS): fall back to the process high-water mark
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def enable_logging(stream=None):
+    if not logger.handlers:
+        handler = logging.StreamHandler(stream)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.propagate = False
+    logger.setLevel(logging.INFO)
+
+
+def begin():
+    # Start collecting stage records in the current context; returns the list they are appended to
+    records = []
+    _records.set(records)
+    return records
+
+
+def submit(pool, fn, *args):
+    # Threads do not inherit context variables, so run pool work in a copy of ours to keep its stages collected
+    return pool.submit(contextvars.copy_context().run, fn, *args)
+
+
+@contextmanager
+def track(stage, rows_in=None, **fields):
+    # Wall time, rows in / out and RSS change of one stage. Set record["rows_out"] inside the block.
+    record = {"stage": stage, "parent": _stage.get(), "rows_in": rows_in, "rows_out": None, **fields}
+    records = _records.get()
+    if records is not None:
+        # Appended on entry, so nested stages follow the stage that contains them
+        records.append(record)
+    token = _stage.set(stage)
+    rss_before = rss_bytes()
+    start = time.perf_counter()
+    try:
+        yield record
+    except BaseException as e:
+        record["error"] = type(e).__name__
+        raise
+    finally:
+        _stage.reset(token)
+        record["seconds"] = round(time.perf_counter() - start, 4)
+        rss = rss_bytes()
+        record["rss_mb"] = round(rss / 2**20, 1)
+        record["rss_delta_mb"] = round((rss - rss_before) / 2**20, 1)
+        logger.info(json.dumps(record, default=str))
+
+
+def start_profiler(kind="cprofile"):
+    if kind == "pyinstrument":
+        from pyinstrument import Profiler
+
+        profiler = Profiler()
+        profiler.start()
+        return profiler
+    if kind != "cprofile":
+        raise ValueError(f"unknown profiler {kind!r}, expected one of {PROFILERS}")
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def stop_profiler(profiler, limit=40):
+    # Returns the profile as text: the top functions by cumulative time, or pyinstrument's call tree
+    if isinstance(profiler, cProfile.Profile):
+        profiler.disable()
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(limit)
+        return out.getvalue()
+    profiler.stop()
+    return profiler.output_text()
@@ -0,0 +1,187 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+import pandas as pd
+
+from b_cities import perf
+from b_cities.ads import CUSTOMER_IDS, get_cached_kw_data
+from b_cities.campaigns import join_campaigns, load_campaigns, strip_campaigns
+from b_cities.metacards import CHUNK_ROWS, METACARD_ENGINE, METACARD_SPECS, ingest_metacard
+from b_cities.report import CAMPAIGN_DATA_COLUMNS, join_acquisitions
+from b_cities.rollup import RollupStore, metacard_fingerprints, report_rows, stored_columns
+
+# Mapping_ref and the output worksheets all live in this spreadsheet
+SHEET_ID = "1RsFcJ9NSFJTggG95zOOU9-kNQJQWwbQ8p6dc2-Ns78g"
+MAPPING_WORKSHEET = "Mapping_ref"
+
+# output name -> (worksheet title, range cleared before a full rewrite)
+OUTPUT_SHEETS = {
+    "campaign_data": ("Trial", ["A:AI"]),
+    "geo_acq_2w_spot": ("Geo_acq_2w_spot", ["A:M"]),
+    "geo_acq_uace": ("Geo_acq_uace", ["A:M"]),
+    "geo_acq_uac": ("Geo_acq_uac", ["A:M"]),
+}
+
+# Worksheets written at the same time by publish
+PUBLISH_WORKERS = 4
+
+
+# Every stage below is recorded with perf.track: wall time, rows in / out and RSS change
+
+
+def fetch_costs(ads_client, start_date, end_date, customer_ids=CUSTOMER_IDS):
+    with perf.track("fetch_costs", start_date=start_date, end_date=end_date) as record:
+        costs = get_cached_kw_data(ads_client, customer_ids, start_date, end_date)
+        record["rows_out"] = len(costs)
+    return costs
+
+
+def load_mapping(get_session, refresh=False, fetch=None):
+    # get_session is only called if Mapping_ref actually has to be checked or downloaded
+    if fetch is None:
+        fetch = lambda: get_session().read(SHEET_ID, MAPPING_WORKSHEET)
+    with perf.track("load_mapping", refresh=refresh) as record:
+        campaigns = load_campaigns(fetch, last_modified=lambda: get_session().last_modified(SHEET_ID), refresh=refresh)
+        record["rows_out"] = None if campaigns is None else len(campaigns["frame"])
+    return campaigns
+
+
+def map_costs(costs, campaigns):
+    with perf.track("map_costs", rows_in=len(costs)) as record:
+        costs = costs.assign(**{"Campaign Name": strip_campaigns(costs["Campaign Name"])})
+        left, right = join_campaigns(costs, costs["Campaign Name"], campaigns)
+        campaign_data = pd.DataFrame({
+            "Date": left["Date"],
+            "Campaign ID_y": right["Campaign ID"],
+            "Campaign Name": left["Campaign Name"],
+            "City": right["City"],
+            "Category": right["Category"],
+            "Cost": left["Cost"],
+        })
+        record["rows_out"] = len(campaign_data)
+    return campaign_data
+
+
+def ingest_source(source, file, campaigns=None, chunksize=CHUNK_ROWS, engine=METACARD_ENGINE):
+    # source is a METACARD_SPECS key; returns (geo aggregate, key-level aggregate)
+    with perf.track(f"ingest_{source}") as record:
+        geo, by_key = ingest_metacard(file, METACARD_SPECS[source], campaigns=campaigns, chunksize=chunksize, engine=engine)
+        record["rows_out"] = len(geo)
+    return geo, by_key
+
+
+def collect_metacards(results):
+    metacards = {}
+    for source, (geo, by_key) in results.items():
+        metacards[f"geo_acq_{source}"] = geo
+        metacards[f"acq_{source}"] = by_key
+    return metacards
+
+
+def ingest_metacards(metacard_2w_spot, metacard_uac, metacard_uace, campaigns, chunksize=CHUNK_ROWS,
+                     engine=METACARD_ENGINE):
+    files = {"2w_spot": metacard_2w_spot, "uace": metacard_uace, "uac": metacard_uac}
+    return collect_metacards({
+        source: ingest_source(source, file, campaigns, chunksize=chunksize, engine=engine)
+        for source, file in files.items()
+    })
+
+
+def build_report(campaign_data, metacards, columns=CAMPAIGN_DATA_COLUMNS):
+    with perf.track("build_report", rows_in=len(campaign_data)) as record:
+        report = join_acquisitions(
+            campaign_data, metacards["acq_2w_spot"], metacards["acq_uace"], metacards["acq_uac"], columns=columns
+        )
+        record["rows_out"] = len(report)
+    return report
+
+
+def rollup_report(store, get_ads_client, campaigns, metacards, start_date, end_date, fingerprints=None, today=None):
+    # Rebuilds only the days the store lacks or holds stale rows for, then returns the range's stored rows
+    # (see report_rows / cost_rows), so moving the range over days already built costs no fetch, mapping or
+    # join; get_ads_client is only called when there are days to build. Pass fingerprints
+    # (metacard_fingerprints of these metacards) to skip hashing them again on every range move.
+    today = today or date.today()
+    if fingerprints is None:
+        fingerprints = metacard_fingerprints(metacards)
+    with perf.track("rollup_update", start_date=start_date, end_date=end_date) as record:
+        days = store.stale_days(start_date, end_date, campaigns["version"], fingerprints, today)
+        if days:
+            costs = fetch_costs(get_ads_client(), days[0].strftime("%Y-%m-%d"), days[-1].strftime("%Y-%m-%d"))
+            campaign_data = map_costs(costs, campaigns)
+            campaign_data = campaign_data[pd.to_datetime(campaign_data["Date"]).isin(days)].reset_index(drop=True)
+            acquisitions = store.acquisitions(metacards, days, fingerprints)
+            report = build_report(campaign_data, acquisitions, columns=stored_columns(acquisitions))
+            rows = report.assign(Date=pd.to_datetime(campaign_data["Date"]), Cost=campaign_data["Cost"])
+            store.append(rows, days, campaigns["version"], fingerprints, today)
+        record["rows_out"] = len(days)
+    return store.slice(start_date, end_date)
+
+
+def report_outputs(campaign_data, metacards):
+    return {
+        "campaign_data": campaign_data,
+        "geo_acq_2w_spot": metacards["geo_acq_2w_spot"],
+        "geo_acq_uace": metacards["geo_acq_uace"],
+        "geo_acq_uac": metacards["geo_acq_uac"],
+    }
+
+
+def _publish_one(session, sheet_id, worksheet_title, frame, clear_range, unchanged):
+    # One sheet failing does not stop the others; its error is reported in its status instead
+    start = time.perf_counter()
+    status = {"worksheet": worksheet_title, "status": "ok", "changed_rows": None, "error": None}
+    try:
+        status["changed_rows"] = session.write(sheet_id, worksheet_title, frame, clear_range, unchanged)
+    except Exception as e:
+        status["status"] = "error"
+        status["error"] = f"{type(e).__name__}: {e}"
+    status["seconds"] = round(time.perf_counter() - start, 3)
+    return status
+
+
+def publish(session, outputs, sheet_id=SHEET_ID, max_workers=PUBLISH_WORKERS):
+    # Writes every output worksheet concurrently over the one session; returns a status per output.
+    # Whether someone else wrote the spreadsheet is checked once, before any of these writes land.
+    with perf.track("publish") as record:
+        unchanged = session.unchanged_since_own_write(sheet_id)
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(OUTPUT_SHEETS)))) as pool:
+            futures = {
+                name: perf.submit(pool, _publish_one, session, sheet_id, worksheet_title, outputs[name], clear_range,
+                                   unchanged)
+                for name, (worksheet_title, clear_range) in OUTPUT_SHEETS.items()
+            }
+            statuses = {name: future.result() for name, future in futures.items()}
+        record["rows_out"] = sum(status["changed_rows"] or 0 for status in statuses.values())
+    return statuses
+
+
+def run(ads_client, get_session, start_date, end_date, metacard_2w_spot, metacard_uac, metacard_uace,
+        refresh_mapping=False, chunksize=CHUNK_ROWS, engine=METACARD_ENGINE, rollup_dir=None):
+    # With rollup_dir, the report comes from (and extends) the daily rollup store there
+    campaigns = load_mapping(get_session, refresh=refresh_mapping)
+    if campaigns is None:
+        raise RuntimeError("Mapping_ref could not be loaded from Google Sheets or the local cache")
+    metacards = ingest_metacards(
+        metacard_2w_spot, metacard_uac, metacard_uace, campaigns, chunksize=chunksize, engine=engine
+    )
+    if rollup_dir is not None:
+        rows = rollup_report(RollupStore(rollup_dir), lambda: ads_client, campaigns, metacards, start_date, end_date)
+        return report_outputs(report_rows(rows), metacards)
+    campaign_data = map_costs(fetch_costs(ads_client, start_date, end_date), campaigns)
+    return report_outputs(build_report(campaign_data, metacards), metacards)
+
+
+def write_outputs(outputs, out_dir, output_format="csv"):
+    os.makedirs(out_dir, exist_ok=True)
+    paths = {}
+    for name, frame in outputs.items():
+        path = os.path.join(out_dir, f"{name}.{output_format}")
+        if output_format == "parquet":
+            frame.to_parquet(path, index=False)
+        else:
+            frame.to_csv(path, index=False)
+        paths[name] = path
+    return paths
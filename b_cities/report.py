@@ -0,0 +1,36 @@
+import pandas as pd
+
+from b_cities.campaigns import parse_campaign_id, strip_campaigns
+from b_cities.metacards import JOIN_KEYS, format_date
+
+# Column layout of the "Trial" sheet
+CAMPAIGN_DATA_COLUMNS = ["Date", "Campaign ID_y", "Campaign Name", "City", "Category", "2W_acq_total", "HCV_acq_total", "LCV_acq_total", "Trucks_acq_total", "PNM_acq", "all_acq_total", "ACQ_2W", "ACQ_HCV", "ACQ_LCV", "ACQ_TRUCKS","2W_UAC", "HCV_UAC", "LCV_UAC", "Trucks_UAC", "Total_UAC", "2W_UACe", "HCV_UACe", "LCV_UACe", "Trucks_UACe", "Total_UACe", "SME_total", "Retail_total","SME_2W_total","SME_Trucks_total", "SME", "Retail", "SME_UAC", "Retail_UAC", "SME_UACe", "Retail_UACe"]
+
+
+def join_acquisitions(campaign_data, acq_2w_spot, acq_uace, acq_uac, columns=CAMPAIGN_DATA_COLUMNS):
+    campaign_data = campaign_data.copy()
+    campaign_data["Campaign ID_y"] = strip_campaigns(campaign_data["Campaign ID_y"].astype(str))
+    dates = pd.to_datetime(campaign_data["Date"])
+
+    # One left join of all three sources on the native (campaign_id, date) key
+    acquisitions = pd.concat([acq_2w_spot, acq_uace, acq_uac], axis=1)
+    keys = pd.DataFrame({"campaign_id": parse_campaign_id(campaign_data["Campaign ID_y"]), "date": dates}, index=campaign_data.index)
+    joined = keys.join(acquisitions, on=JOIN_KEYS)
+    campaign_data = pd.concat([campaign_data, joined[acquisitions.columns]], axis=1)
+    campaign_data["Date"] = format_date(dates)
+
+    # create total columns in campaign data named 2W_acq_total, LCV_acq_total, HCV_acq_total, Trucks_acq_total, PNM_acq, all_acq_total
+    # fill na
+    campaign_data = campaign_data.fillna(0)
+    campaign_data["2W_acq_total"] = campaign_data["ACQ_2W"] + campaign_data["2W_UAC"] + campaign_data["2W_UACe"]
+    campaign_data["LCV_acq_total"] = campaign_data["ACQ_LCV"] + campaign_data["LCV_UAC"] + campaign_data["LCV_UACe"]
+    campaign_data["HCV_acq_total"] = campaign_data["ACQ_HCV"] + campaign_data["HCV_UAC"] + campaign_data["HCV_UACe"]
+    campaign_data["Trucks_acq_total"] = campaign_data["ACQ_TRUCKS"] + campaign_data["Trucks_UAC"] + campaign_data["Trucks_UACe"]
+    campaign_data["PNM_acq"] = campaign_data["PNM_CONV"]
+    campaign_data["all_acq_total"] = campaign_data["2W_acq_total"] + campaign_data["Trucks_acq_total"] + campaign_data["PNM_acq"]
+    campaign_data["SME_total"] = campaign_data["SME"] + campaign_data["SME_UAC"] + campaign_data["SME_UACe"]
+    campaign_data["Retail_total"] = campaign_data["Retail"] + campaign_data["Retail_UAC"] + campaign_data["Retail_UACe"]
+    campaign_data["SME_2W_total"] = campaign_data["SME_2W"] + campaign_data["SME_2W_UAC"] + campaign_data["SME_2W_UACe"]
+    campaign_data["SME_Trucks_total"] = campaign_data["SME_Trucks"] + campaign_data["SME_Trucks_UAC"] + campaign_data["SME_Trucks_UACe"]
+
+    return campaign_data[columns]
@@ -0,0 +1,234 @@
+import json
+import os
+import threading
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from b_cities import perf
+from b_cities.ads import RESTATEMENT_DAYS
+from b_cities.campaigns import parse_campaign_id
+from b_cities.metacards import JOIN_KEYS, METACARD_SPECS, format_date
+from b_cities.report import CAMPAIGN_DATA_COLUMNS
+
+# Joined report rows by day: one parquet file per month, a manifest of what each stored day was built from,
+# and the per-day totals behind range sums
+ROLLUP_DIR = os.path.join(".cache", "rollup")
+
+# Bump when the stored columns change; a store with another layout is started over
+ROLLUP_LAYOUT = 1
+
+# Summed by RollupStore.totals: cost and every acquisition column of the report
+METRIC_COLUMNS = ["Cost", *CAMPAIGN_DATA_COLUMNS[5:]]
+
+
+def _iso(day):
+    return day.strftime("%Y-%m-%d")
+
+
+def _months(days):
+    return sorted({day.strftime("%Y-%m") for day in days})
+
+
+def metacard_fingerprints(metacards):
+    # {source: {day: content hash of that day's key-level rows}} for every day between a source's first and
+    # last date; a day inside that span with no rows is a real zero, so it gets a hash too
+    fingerprints = {}
+    for source in METACARD_SPECS:
+        frame = metacards[f"acq_{source}"]
+        hashes = pd.util.hash_pandas_object(frame.reset_index(), index=False).to_numpy() % 2**32
+        sums = pd.Series(hashes.astype(np.int64)).groupby(frame.index.get_level_values("date").to_numpy()).sum()
+        span = pd.date_range(sums.index.min(), sums.index.max()) if len(sums) else pd.DatetimeIndex([])
+        sums = sums.reindex(span, fill_value=0)
+        fingerprints[source] = dict(zip(span.strftime("%Y-%m-%d"), sums.astype(str)))
+    return fingerprints
+
+
+def stored_columns(acquisitions):
+    # The report columns plus every source column the report only folds into totals, so a day's
+    # acquisitions can be carried over from the store
+    extra = [
+        column for source in METACARD_SPECS for column in acquisitions[f"acq_{source}"].columns
+        if column not in CAMPAIGN_DATA_COLUMNS
+    ]
+    return CAMPAIGN_DATA_COLUMNS + extra
+
+
+def cost_rows(rows):
+    # Stored rows in the layout of map_costs
+    return rows[[*CAMPAIGN_DATA_COLUMNS[:5], "Cost"]].reset_index(drop=True)
+
+
+def report_rows(rows):
+    # Stored rows in the layout of the "Trial" sheet
+    return rows.assign(Date=format_date(rows["Date"]))[CAMPAIGN_DATA_COLUMNS].reset_index(drop=True)
+
+
+class RollupStore:
+    # Safe to share between threads: partitions and the manifest are only read or replaced under the lock
+
+    def __init__(self, path=ROLLUP_DIR):
+        self.path = path
+        self._lock = threading.Lock()
+        self._partitions = {}
+        self._manifest = self._read_manifest()
+        self._cumulative = None
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _read_manifest(self):
+        try:
+            with open(self._file("manifest.json")) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = None
+        if manifest is None or manifest.get("layout") != ROLLUP_LAYOUT:
+            return {"layout": ROLLUP_LAYOUT, "days": {}}
+        return manifest
+
+    def _replace(self, name, write):
+        # Write next to the target and swap it in, so readers never see half a file
+        os.makedirs(self.path, exist_ok=True)
+        write(self._file(name) + ".tmp")
+        os.replace(self._file(name) + ".tmp", self._file(name))
+
+    def _partition(self, month):
+        # Loaded partitions are kept while their file is unchanged
+        path = self._file(f"month={month}.parquet")
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+        cached = self._partitions.get(month)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, pd.read_parquet(path))
+            self._partitions[month] = cached
+        return cached[1]
+
+    def _rows(self, start, end):
+        # Only the partitions of months the range touches are read; each is sorted by Date
+        frames = []
+        for month in _months(pd.date_range(start.replace(day=1), end)):
+            frame = self._partition(month)
+            if frame is not None:
+                dates = frame["Date"].to_numpy()
+                first = np.searchsorted(dates, np.datetime64(start), "left")
+                last = np.searchsorted(dates, np.datetime64(end), "right")
+                frames.append(frame.iloc[first:last])
+        return pd.concat(frames, ignore_index=True) if frames else None
+
+    def _stale(self, record, day, mapping_version, fingerprints, today):
+        if record is None or record["mapping"] != mapping_version:
+            return True
+        # A source only invalidates the days its upload covers; other days keep what was stored for them
+        if any(day in days and days[day] != record["metacards"].get(source) for source, days in fingerprints.items()):
+            return True
+        # Costs inside the Ads restatement window at build time can still change until the window has passed
+        built_on = date.fromisoformat(record["built_on"])
+        return built_on < today and day >= _iso(built_on - timedelta(days=RESTATEMENT_DAYS))
+
+    def stale_days(self, start_date, end_date, mapping_version, fingerprints, today=None):
+        # Days in the range that are missing, built from another Mapping_ref or other metacard rows, or may
+        # have restated costs
+        today = today or date.today()
+        days = self._manifest["days"]
+        return [
+            day for day in pd.date_range(start_date, end_date)
+            if self._stale(days.get(_iso(day)), _iso(day), mapping_version, fingerprints, today)
+        ]
+
+    def acquisitions(self, metacards, days, fingerprints):
+        # Key-level frames to rebuild the given days from: the upload's rows where a source covers the day,
+        # and the acquisitions stored with the day where it does not (so earlier uploads are not lost)
+        carried = {}
+        for source, covered in fingerprints.items():
+            frame = metacards[f"acq_{source}"]
+            missing = [day for day in days if _iso(day) not in covered and _iso(day) in self._manifest["days"]]
+            with self._lock:
+                rows = self._rows(min(missing), max(missing)) if missing else None
+            if rows is not None:
+                rows = rows[rows["Date"].isin(missing)]
+                keys = pd.DataFrame({
+                    "campaign_id": parse_campaign_id(rows["Campaign ID_y"]).to_numpy(),
+                    "date": rows["Date"].to_numpy().astype(frame.index.levels[1].dtype),
+                })
+                stored = pd.concat([keys, rows[frame.columns].reset_index(drop=True)], axis=1)
+                stored = stored.dropna(subset=["campaign_id"]).groupby(JOIN_KEYS).first()
+                frame = pd.concat([frame, stored])
+            carried[f"acq_{source}"] = frame
+        return carried
+
+    def append(self, rows, days, mapping_version, fingerprints, today=None):
+        # rows are stored rows (Date as datetime, Cost, report columns) for exactly these days; they replace
+        # whatever was stored for them
+        today = today or date.today()
+        days = pd.DatetimeIndex(days)
+        with self._lock, perf.track("rollup_append", rows_in=len(rows), days=len(days)) as record:
+            rows = rows.sort_values("Date", kind="stable")
+            for month in _months(days):
+                previous = self._partition(month)
+                month_start = pd.Timestamp(f"{month}-01")
+                in_month = rows[(rows["Date"] >= month_start) & (rows["Date"] < month_start + pd.offsets.MonthBegin())]
+                if previous is not None:
+                    kept = previous[~previous["Date"].isin(days)]
+                    in_month = pd.concat([kept, in_month], ignore_index=True).sort_values("Date", kind="stable")
+                self._replace(f"month={month}.parquet", lambda path: in_month.to_parquet(path, index=False))
+
+            # Days keep the fingerprint of whatever rows they were built from, carried ones included
+            for day in days:
+                iso = _iso(day)
+                stored = self._manifest["days"].get(iso) or {"metacards": {}}
+                self._manifest["days"][iso] = {
+                    "built_on": today.isoformat(),
+                    "mapping": mapping_version,
+                    "metacards": {
+                        source: covered.get(iso, stored["metacards"].get(source))
+                        for source, covered in fingerprints.items()
+                    },
+                }
+            daily = rows.groupby("Date")[METRIC_COLUMNS].sum().reindex(days, fill_value=0)
+            previous = self._daily()
+            if previous is not None:
+                daily = pd.concat([previous[~previous.index.isin(days)], daily]).sort_index()
+            self._replace("daily.parquet", lambda path: daily.rename_axis("Date").to_parquet(path))
+            self._replace("manifest.json", lambda path: _dump(self._manifest, path))
+            self._cumulative = None
+            record["rows_out"] = len(rows)
+
+    def _daily(self):
+        try:
+            return pd.read_parquet(self._file("daily.parquet"))
+        except OSError:
+            return None
+
+    def slice(self, start_date, end_date):
+        # Stored rows for the range
+        with self._lock, perf.track("rollup_slice", start_date=start_date, end_date=end_date) as record:
+            rows = self._rows(pd.Timestamp(start_date), pd.Timestamp(end_date))
+            if rows is None:
+                rows = pd.DataFrame({column: [] for column in ["Date", "Cost", *CAMPAIGN_DATA_COLUMNS[1:]]})
+                rows["Date"] = pd.to_datetime(rows["Date"])
+            record["rows_out"] = len(rows)
+        return rows
+
+    def totals(self, start_date, end_date):
+        # Sum of every metric over the range: two lookups in the running per-day totals, however long the range
+        with self._lock:
+            if self._cumulative is None:
+                daily = self._daily()
+                if daily is None:
+                    daily = pd.DataFrame(columns=METRIC_COLUMNS, index=pd.DatetimeIndex([]), dtype=float)
+                running = np.vstack([np.zeros(len(METRIC_COLUMNS)), daily.to_numpy(dtype=float).cumsum(axis=0)])
+                self._cumulative = (daily.index.to_numpy(), running)
+            days, running = self._cumulative
+        first = np.searchsorted(days, np.datetime64(pd.Timestamp(start_date)), "left")
+        last = np.searchsorted(days, np.datetime64(pd.Timestamp(end_date)), "right")
+        # Cost is in micros, so rounding drops the float error of the subtraction
+        return pd.Series(running[last] - running[first], index=METRIC_COLUMNS).round(6)
+
+
+def _dump(manifest, path):
+    with open(path, "w") as f:
+        json.dump(manifest, f)
@@ -0,0 +1,205 @@
+import random
+import threading
+import time
+
+import pandas as pd
+
+from b_cities import perf
+
+SCOPES = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+
+# Upper bound on cells sent in one values_batch_update call
+BATCH_CELLS = 50_000
+
+# Rate-limited (429) and transient server errors are retried with truncated exponential backoff and jitter,
+# or after the Retry-After the API asked for
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+API_RETRIES = 5
+API_BACKOFF_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 32.0
+
+
+def frame_to_rows(dataframe):
+    # Handle NaN values in the DataFrame and convert it to a list of lists with a header row
+    dataframe = dataframe.fillna('')
+    return [dataframe.columns.values.tolist()] + dataframe.values.tolist()
+
+
+def _changed_ranges(previous, rows):
+    # Contiguous runs of 0-based row indices whose values differ from the last written snapshot
+    ranges = []
+    for i in range(max(len(previous), len(rows))):
+        old = previous[i] if i < len(previous) else None
+        new = rows[i] if i < len(rows) else None
+        if old == new:
+            continue
+        if ranges and ranges[-1][1] == i - 1:
+            ranges[-1][1] = i
+        else:
+            ranges.append([i, i])
+    return ranges
+
+
+def _padded(rows, start, end, previous, width):
+    # Rows that shrank (or disappeared) are padded with blanks so stale cells get overwritten
+    block = []
+    for i in range(start, end + 1):
+        row = list(rows[i]) if i < len(rows) else []
+        old_width = len(previous[i]) if i < len(previous) else 0
+        block.append(row + [""] * (max(width, old_width) - len(row)))
+    return block
+
+
+def _quoted(worksheet_title):
+    return "'" + worksheet_title.replace("'", "''") + "'"
+
+
+def _retry_delay(error, attempt, backoff):
+    # Seconds to wait before retrying a failed API call, or None if it should not be retried
+    response = getattr(error, "response", None)
+    if getattr(response, "status_code", None) not in RETRY_STATUSES:
+        return None
+    retry_after = (getattr(response, "headers", None) or {}).get("Retry-After")
+    try:
+        return float(retry_after)
+    except (TypeError, ValueError):
+        return min(backoff * 2 ** attempt, MAX_BACKOFF_SECONDS) + random.uniform(0, backoff)
+
+
+class SheetsSession:
+    # One authorized gspread client with cached spreadsheet / worksheet handles and write snapshots.
+    # Safe to share between threads (and Streamlit sessions): writes to one worksheet take turns.
+
+    def __init__(self, client, retries=API_RETRIES, backoff=API_BACKOFF_SECONDS):
+        self.client = client
+        self.retries = retries
+        self.backoff = backoff
+        self._spreadsheets = {}
+        self._worksheets = {}
+        self._snapshots = {}
+        # Per spreadsheet, the modified times it had right after writes from this session
+        self._own_versions = {}
+        self._write_locks = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_service_account(cls, credentials):
+        import gspread
+
+        return cls(gspread.service_account_from_dict(dict(credentials), scopes=SCOPES))
+
+    def spreadsheet(self, sheet_id):
+        with self._lock:
+            if sheet_id not in self._spreadsheets:
+                self._spreadsheets[sheet_id] = self.client.open_by_key(sheet_id)
+            return self._spreadsheets[sheet_id]
+
+    def worksheet(self, sheet_id, worksheet_title):
+        spreadsheet = self.spreadsheet(sheet_id)
+        with self._lock:
+            key = (sheet_id, worksheet_title)
+            if key not in self._worksheets:
+                self._worksheets[key] = spreadsheet.worksheet(worksheet_title)
+            return self._worksheets[key]
+
+    def last_modified(self, sheet_id):
+        # Drive modified time of the spreadsheet; None where this gspread version cannot fetch it
+        spreadsheet = self.spreadsheet(sheet_id)
+        if hasattr(spreadsheet, "get_lastUpdateTime"):
+            return spreadsheet.get_lastUpdateTime()
+        return None
+
+    def read(self, sheet_id, worksheet_title):
+        with perf.track("sheets_read", worksheet=worksheet_title) as record:
+            data = self._call(self.worksheet(sheet_id, worksheet_title).get_all_values)
+            record["rows_out"] = max(len(data) - 1, 0)
+        return pd.DataFrame(data[1:], columns=data[0])
+
+    def write(self, sheet_id, worksheet_title, dataframe, clear_range, unchanged=None):
+        # Returns the number of sheet rows sent to the API. unchanged is the result of
+        # unchanged_since_own_write(sheet_id), if the caller already checked it for several writes.
+        with perf.track("sheets_write", rows_in=len(dataframe), worksheet=worksheet_title) as record:
+            record["rows_out"] = self._write(sheet_id, worksheet_title, dataframe, clear_range, unchanged)
+        return record["rows_out"]
+
+    def _write(self, sheet_id, worksheet_title, dataframe, clear_range, unchanged):
+        key = (sheet_id, worksheet_title)
+        with self._lock:
+            write_lock = self._write_locks.setdefault(key, threading.Lock())
+        with write_lock:
+            if unchanged is None:
+                unchanged = self.unchanged_since_own_write(sheet_id)
+            return self._write_locked(sheet_id, worksheet_title, dataframe, clear_range, unchanged)
+
+    def _modified(self, sheet_id):
+        # None when the modified time cannot be fetched; writes then fall back to clear and rewrite
+        try:
+            return self._call(self.last_modified, sheet_id)
+        except Exception:
+            return None
+
+    def unchanged_since_own_write(self, sheet_id):
+        # True if nobody else (another process, the CLI) wrote the spreadsheet since this session last did.
+        # Otherwise every snapshot of the spreadsheet is stale and is dropped. The modified time covers the
+        # whole spreadsheet, so writes to several of its worksheets at once share one check made beforehand:
+        # checked during the others, it would see their writes and throw every snapshot away.
+        modified = self._modified(sheet_id)
+        with self._lock:
+            if modified is not None and modified in self._own_versions.get(sheet_id, ()):
+                self._own_versions[sheet_id] = {modified}
+                return True
+            self._own_versions.pop(sheet_id, None)
+            for key in [key for key in self._snapshots if key[0] == sheet_id]:
+                del self._snapshots[key]
+            return False
+
+    def _write_locked(self, sheet_id, worksheet_title, dataframe, clear_range, unchanged):
+        rows = frame_to_rows(dataframe)
+        worksheet = self.worksheet(sheet_id, worksheet_title)
+        key = (sheet_id, worksheet_title)
+        with self._lock:
+            previous = self._snapshots.pop(key, None) if unchanged else None
+
+        if previous is None:
+            # Nothing written from this session yet, or the sheet changed since: its contents are unknown,
+            # so clear and rewrite
+            self._call(worksheet.batch_clear, clear_range)
+            previous = []
+        ranges = _changed_ranges(previous, rows)
+
+        width = max((len(row) for row in rows), default=0)
+        requests, cells = [], 0
+        for start, end in ranges:
+            # Split long runs so no single request carries more than BATCH_CELLS cells
+            step = max(1, BATCH_CELLS // max(width, 1))
+            for chunk_start in range(start, end + 1, step):
+                chunk_end = min(end, chunk_start + step - 1)
+                block = _padded(rows, chunk_start, chunk_end, previous, width)
+                if requests and cells + len(block) * width > BATCH_CELLS:
+                    self._send(sheet_id, requests)
+                    requests, cells = [], 0
+                requests.append({"range": f"{_quoted(worksheet_title)}!A{chunk_start + 1}", "values": block})
+                cells += len(block) * width
+        if requests:
+            self._send(sheet_id, requests)
+
+        modified = self._modified(sheet_id)
+        with self._lock:
+            self._snapshots[key] = rows
+            if modified is not None:
+                self._own_versions.setdefault(sheet_id, set()).add(modified)
+        return sum(end - start + 1 for start, end in ranges)
+
+    def _send(self, sheet_id, data):
+        self._call(self.spreadsheet(sheet_id).values_batch_update, {"valueInputOption": "RAW", "data": data})
+
+    def _call(self, fn, *args):
+        # Every request here is idempotent, so a rate-limited one can simply be sent again
+        for attempt in range(self.retries + 1):
+            try:
+                return fn(*args)
+            except Exception as e:
+                delay = _retry_delay(e, attempt, self.backoff)
+                if delay is None or attempt == self.retries:
+                    raise
+                time.sleep(delay)
@@ -0,0 +1,109 @@
+# Compare the original UACE code path (per-row np.where flags, then grouping the raw rows once per output)
+# with one fine-grain pass plus roll-ups, and check both give the same sums.
+#   python benchmarks/bench_aggregate.py [rows]
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from b_cities.metacards import DIMENSIONS, METACARD_SPECS, _aggregate_chunk, _combine, _flag_table, _roll_up
+
+
+def make_uace_rows(rows, campaigns=150, days=90, seed=0):
+    rng = np.random.default_rng(seed)
+    campaign_ids = rng.integers(10_000_000, 99_999_999, campaigns)
+    names = np.array([f"UACe_Campaign_{i} ({campaign_id})" for i, campaign_id in enumerate(campaign_ids)], dtype=object)
+    dates = pd.date_range("2024-01-01", periods=days).strftime("%d-%m-%Y").to_numpy(dtype=object)
+    regions = pd.array(rng.integers(0, 35, rows), dtype="Int32")
+    regions[rng.random(rows) < 0.05] = pd.NA
+    return pd.DataFrame({
+        "VEHICLE_ID": pd.array(rng.choice([97, 126, 1, 9, 133, 0, 55], rows), dtype="Int32"),
+        "FREQ": pd.array(rng.integers(1, 7, rows), dtype="Int8"),
+        "GEO_REGION_ID": regions,
+        "CAMPAIGN_NAME": pd.Series(names[rng.integers(0, campaigns, rows)], dtype=str),
+        "ORDER_DATE": pd.Series(dates[rng.integers(0, days, rows)], dtype=str),
+    })
+
+
+def as_read_by_original(chunk):
+    # The original read the whole CSV with default dtypes; CUSTOMER_ID was counted, so it is never missing here
+    return pd.DataFrame({
+        "VEHICLE_ID": chunk["VEHICLE_ID"].astype("int64"),
+        "FREQ": chunk["FREQ"].astype("int64"),
+        "GEO_REGION_ID": chunk["GEO_REGION_ID"].astype("float64"),
+        "CAMPAIGN_NAME": chunk["CAMPAIGN_NAME"].astype(object),
+        "ORDER_DATE": chunk["ORDER_DATE"].astype(object),
+        "CUSTOMER_ID": np.arange(len(chunk)),
+    })
+
+
+def original(df):
+    # The UACE steps of the original script, unchanged apart from the session state
+    flags = METACARD_SPECS["uace"]["key_columns"]
+    df["Vehicle"] = df["VEHICLE_ID"].map(DIMENSIONS["vehicle"]["labels"])
+    df["2W_UACe"] = np.where(df["Vehicle"] == "2W", 1, 0)
+    df["LCV_UACe"] = np.where(df["Vehicle"] == "LCV", 1, 0)
+    df["HCV_UACe"] = np.where(df["Vehicle"] == "HCV", 1, 0)
+    df = df.fillna(0)
+    df["Trucks_UACe"] = df["LCV_UACe"] + df["HCV_UACe"]
+    df["Total_UACe"] = df["2W_UACe"] + df["Trucks_UACe"]
+    df["SME_UACe"] = np.where(df["FREQ"] == 4, 1, 0)
+    df["Retail_UACe"] = np.where((df["FREQ"] == 5) | (df["FREQ"] == 6), 1, 0)
+    df["SME_2W_UACe"] = np.where((df["FREQ"] == 4) & (df["Vehicle"] == "2W"), 1, 0)
+    df["SME_Trucks_UACe"] = np.where((df["FREQ"] == 4) & ((df["Vehicle"] == "LCV") | (df["Vehicle"] == "HCV")), 1, 0)
+    df["City"] = df["GEO_REGION_ID"].map(DIMENSIONS["city"]["labels"])
+    df["Campaign"] = df["CAMPAIGN_NAME"].str.extract(r'^(.*?)(?=\()')
+    df["Campaign"] = df["Campaign"].str.strip()
+    geo = df.groupby(["ORDER_DATE", "Campaign", "City"]).agg({"CUSTOMER_ID": "count", **{f: "sum" for f in flags}})
+    geo = geo.reset_index()[METACARD_SPECS["uace"]["geo_columns"]]
+
+    df["Campaign ID"] = df["CAMPAIGN_NAME"].str.extract(r'\((\d+)\)$')
+    df["ORDER_DATE"] = pd.to_datetime(df["ORDER_DATE"], format="%d-%m-%Y")
+    df["key"] = df["Campaign ID"] + "_" + df["ORDER_DATE"].dt.strftime("%d-%m-%Y")
+    by_key = df.groupby("key").agg({f: "sum" for f in flags})
+    return geo, by_key
+
+
+def single_pass(chunk, spec, table):
+    fine = _combine([_aggregate_chunk(chunk, spec, table)], spec).reset_index()
+    return _roll_up(spec["derive"](fine, None), spec)
+
+
+def keyed_like_original(by_key):
+    # (campaign_id, date) index -> the original "<id>_<dd-mm-YYYY>" key
+    by_key = by_key[by_key.index.get_level_values("campaign_id").notna()]
+    ids = by_key.index.get_level_values("campaign_id").astype(str)
+    dates = by_key.index.get_level_values("date").strftime("%d-%m-%Y")
+    return by_key.set_axis(pd.Index(ids + "_" + dates, name="key")).sort_index()
+
+
+def timed(fn, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000
+    spec = METACARD_SPECS["uace"]
+    table = _flag_table(spec["flags"])
+    chunk = make_uace_rows(rows)
+
+    raw = as_read_by_original(chunk)
+    original_seconds, (geo_a, key_a) = timed(lambda: original(raw.copy()))
+    single_pass_seconds, (geo_b, key_b) = timed(lambda: single_pass(chunk, spec, table))
+    pd.testing.assert_frame_equal(geo_a, geo_b, check_dtype=False)
+    pd.testing.assert_frame_equal(key_a, keyed_like_original(key_b), check_dtype=False)
+
+    print(f"rows:        {rows:,}")
+    print(f"original:    {original_seconds:.3f}s")
+    print(f"single pass: {single_pass_seconds:.3f}s")
+    print(f"speedup:     {original_seconds / single_pass_seconds:.2f}x")
@@ -0,0 +1,137 @@
+# Check the SQLite cost cache against the fake GoogleAdsService, and time a cold pull against a cached one:
+# only dates not stored yet are fetched, the restatement window is always refetched, days without spend are
+# remembered, and a cached read returns exactly what a direct fetch_kw_data does. Also checks the sharded
+# fetch: job order, retrying only transient errors, keeping the shards that landed when one fails, and (with
+# per-query latency on the fake) that fetching the shards concurrently takes about one shard's time, not the sum.
+#   python benchmarks/bench_cost_cache.py [days] [latency_seconds]
+import os
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from b_cities.ads import (CUSTOMER_IDS, FETCH_WORKERS, RESTATEMENT_DAYS, _month_shards, fetch_kw_data,
+                          get_cached_kw_data, get_kw_data)
+from synthetic import START_DATE, FakeGoogleAdsClient
+
+
+def day(offset):
+    return START_DATE + timedelta(days=offset)
+
+
+def fetched_days(client):
+    # Every (customer_id, day) the fake was asked for, in query order
+    return [
+        (customer_id, start + timedelta(days=i))
+        for customer_id, start, end in client.service.queries
+        for i in range((end - start).days + 1)
+    ]
+
+
+def cached(client, cache_path, start, end, today):
+    client.service.queries.clear()
+    frame = get_cached_kw_data(client, CUSTOMER_IDS, start.isoformat(), end.isoformat(), cache_path=cache_path,
+                               today=today, backoff=0)
+    return frame, fetched_days(client)
+
+
+if __name__ == "__main__":
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 120
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.2
+    cache_path = os.path.join(tempfile.mkdtemp(prefix="bench_cost_cache_"), "kw.sqlite")
+    # "Today" is well after the range, so only the second check touches the restatement window
+    today = day(days + 30)
+    client = FakeGoogleAdsClient()
+
+    start = time.perf_counter()
+    first, fetched = cached(client, cache_path, day(0), day(days // 2 - 1), today)
+    cold_seconds = time.perf_counter() - start
+    assert sorted(fetched) == sorted((c, day(i)) for c in CUSTOMER_IDS for i in range(days // 2)), "cold pull"
+
+    # Extending the range fetches only the new dates
+    full, fetched = cached(client, cache_path, day(0), day(days - 1), today)
+    assert sorted(fetched) == sorted((c, day(i)) for c in CUSTOMER_IDS for i in range(days // 2, days)), "extension"
+
+    # A cached read is what a direct pull returns
+    direct = fetch_kw_data(client, CUSTOMER_IDS, day(0).isoformat(), day(days - 1).isoformat(), backoff=0)
+    pd.testing.assert_frame_equal(full, direct, check_categorical=False)
+
+    start = time.perf_counter()
+    again, fetched = cached(client, cache_path, day(0), day(days - 1), today)
+    cached_seconds = time.perf_counter() - start
+    assert fetched == [], "fully cached range hit the API"
+    pd.testing.assert_frame_equal(again, full)
+
+    # The restatement window is refetched even though it is stored
+    recent = day(days - 1)
+    _, fetched = cached(client, cache_path, day(0), recent, recent)
+    window = [day(days - 1 - i) for i in range(RESTATEMENT_DAYS + 1)]
+    assert sorted(fetched) == sorted((c, d) for c in CUSTOMER_IDS for d in window), "restatement window"
+
+    # Days without spend are recorded as fetched, so they are not asked for again
+    quiet = FakeGoogleAdsClient(empty_days=[day(1), day(2)])
+    quiet_path = cache_path + ".quiet"
+    frame, _ = cached(quiet, quiet_path, day(0), day(3), today)
+    assert set(frame["Date"].dt.date) == {day(0), day(3)}
+    _, fetched = cached(quiet, quiet_path, day(0), day(3), today)
+    assert fetched == [], "empty days were fetched again"
+
+    # Shards come back in (account, month) order however they finish
+    shards = [(day(0), day(30)), (day(31), day(59)), (day(60), day(90))]
+    sequential = pd.concat([
+        get_kw_data(client, c, shard_start.isoformat(), shard_end.isoformat())
+        for c in CUSTOMER_IDS for shard_start, shard_end in shards
+    ], ignore_index=True)
+    concurrent = fetch_kw_data(client, CUSTOMER_IDS, day(0).isoformat(), day(90).isoformat(), backoff=0)
+    pd.testing.assert_frame_equal(concurrent, sequential, check_categorical=False)
+
+    # A transient error is retried; a permanent one is raised after a single call
+    flaky = FakeGoogleAdsClient(campaigns=3)
+    flaky.service.failures[(CUSTOMER_IDS[0], day(0))] = [ConnectionError("reset"), TimeoutError("slow")]
+    fetch_kw_data(flaky, CUSTOMER_IDS[:1], day(0).isoformat(), day(0).isoformat(), backoff=0)
+    assert flaky.service.calls == 3, flaky.service.calls
+    flaky.service.calls = 0
+    flaky.service.failures[(CUSTOMER_IDS[0], day(0))] = [PermissionError("denied")]
+    try:
+        fetch_kw_data(flaky, CUSTOMER_IDS[:1], day(0).isoformat(), day(0).isoformat(), backoff=0)
+    except PermissionError:
+        pass
+    else:
+        raise AssertionError("permanent error was swallowed")
+    assert flaky.service.calls == 1, flaky.service.calls
+
+    # When one shard fails, the others are stored, and a rerun fetches only the failed one
+    failing_path = cache_path + ".failing"
+    flaky.service.failures[(CUSTOMER_IDS[0], day(31))] = [PermissionError("denied")]
+    try:
+        cached(flaky, failing_path, day(0), day(90), today)
+    except PermissionError:
+        pass
+    else:
+        raise AssertionError("failed shard was swallowed")
+    _, fetched = cached(flaky, failing_path, day(0), day(90), today)
+    assert sorted(fetched) == [(CUSTOMER_IDS[0], day(i)) for i in range(31, 60)], "only the failed shard is refetched"
+
+    # Every query waits the same round trip: sequential wall time is the sum, concurrent is about one shard
+    # for as long as there are no more shards than workers
+    slow = FakeGoogleAdsClient(campaigns=3, latency=latency)
+    shard_count = len(CUSTOMER_IDS) * len(_month_shards(day(0), day(45)))
+    assert shard_count <= FETCH_WORKERS, shard_count
+    start = time.perf_counter()
+    fetch_kw_data(slow, CUSTOMER_IDS, day(0).isoformat(), day(45).isoformat(), max_workers=1, backoff=0)
+    sequential_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    fetch_kw_data(slow, CUSTOMER_IDS, day(0).isoformat(), day(45).isoformat(), backoff=0)
+    concurrent_seconds = time.perf_counter() - start
+    assert sequential_seconds >= shard_count * latency, sequential_seconds
+    assert concurrent_seconds < 1.5 * latency, f"{concurrent_seconds:.3f}s for {shard_count} shards of {latency}s"
+
+    print(f"cache checks passed over {days} days, {len(full):,} cost rows")
+    print(f"cold pull ({days // 2} days): {cold_seconds:.3f}s")
+    print(f"cached ({days} days):     {cached_seconds:.3f}s")
+    print(f"sequential ({shard_count} shards): {sequential_seconds:.3f}s")
+    print(f"concurrent ({shard_count} shards): {concurrent_seconds:.3f}s")
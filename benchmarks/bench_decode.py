@@ -0,0 +1,74 @@
+# Compare the columnar search_stream decoder with the old dict-per-row path.
+#   python benchmarks/bench_decode.py [rows]
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from b_cities.ads import get_kw_data
+
+
+class FakeGoogleAdsService:
+    def __init__(self, batches):
+        self.batches = batches
+
+    def search_stream(self, customer_id, query):
+        return iter(self.batches)
+
+
+class FakeGoogleAdsClient:
+    def __init__(self, batches):
+        self.service = FakeGoogleAdsService(batches)
+
+    def get_service(self, name, version=None):
+        return self.service
+
+
+def make_batches(rows, batch_size=10000, campaigns=200, days=400):
+    results = []
+    for i in range(rows):
+        campaign_id = 10_000_000 + i % campaigns
+        results.append(SimpleNamespace(
+            segments=SimpleNamespace(date=(pd.Timestamp("2024-01-01") + pd.Timedelta(days=i % days)).strftime("%Y-%m-%d")),
+            campaign=SimpleNamespace(name=f"Campaign_{campaign_id}", id=campaign_id),
+            metrics=SimpleNamespace(cost_micros=(i * 7919) % 50_000_000),
+        ))
+    return [SimpleNamespace(results=results[i:i + batch_size]) for i in range(0, rows, batch_size)]
+
+
+def dict_decode(batches):
+    # The decoder get_kw_data used before the columnar buffers
+    data = []
+    for batch in batches:
+        for row in batch.results:
+            data.append({
+                "Date": row.segments.date if hasattr(row.segments, 'date') else 'NA',
+                "Campaign Name": row.campaign.name if hasattr(row.campaign, 'name') else 'NA',
+                "Campaign ID": row.campaign.id if hasattr(row.campaign, 'id') else 'NA',
+                "Cost": row.metrics.cost_micros / 1e6 if hasattr(row.metrics, 'cost_micros') else 0,
+            })
+    return pd.DataFrame(data)
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    batches = make_batches(rows)
+    client = FakeGoogleAdsClient(batches)
+
+    dict_seconds, dict_df = timed(lambda: dict_decode(batches))
+    columnar_seconds, columnar_df = timed(lambda: get_kw_data(client, "0", "2024-01-01", "2025-02-03"))
+
+    print(f"rows:     {rows:,}")
+    print(f"dict:     {dict_seconds:.3f}s  {dict_df.memory_usage(deep=True).sum() / 1e6:.1f} MB")
+    print(f"columnar: {columnar_seconds:.3f}s  {columnar_df.memory_usage(deep=True).sum() / 1e6:.1f} MB")
+    print(f"speedup:  {dict_seconds / columnar_seconds:.2f}x")
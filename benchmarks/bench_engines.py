@@ -0,0 +1,72 @@
+# Check that the pandas and duckdb metacard engines produce identical outputs, and time both. pandas also runs
+# with small chunks, so chunk aggregates are folded into the running total many times, and both engines
+# must give empty outputs for header-only metacards.
+#   python benchmarks/bench_engines.py [rows]
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from b_cities.campaigns import build_campaigns
+from b_cities.metacards import CHUNK_ROWS, COMBINE_EVERY
+from b_cities.pipeline import build_report, ingest_metacards, ingest_source
+from synthetic import START_DATE, campaign_table, make_mapping_ref, make_metacards
+
+
+def make_campaign_data(campaigns, days):
+    ids, names = campaign_table(campaigns)
+    return pd.DataFrame({
+        "Date": np.repeat(pd.date_range(START_DATE, periods=days).strftime("%Y-%m-%d"), campaigns),
+        "Campaign ID_y": np.tile(ids.astype(str), days),
+        "Campaign Name": np.tile(names, days),
+        "City": "Pune",
+        "Category": "2W",
+        "Cost": np.random.default_rng(0).random(days * campaigns),
+    })
+
+
+def run_engine(paths, campaign_data, campaigns, engine, chunksize=CHUNK_ROWS):
+    start = time.perf_counter()
+    metacards = ingest_metacards(paths["2w_spot"], paths["uac"], paths["uace"], campaigns, chunksize=chunksize,
+                                 engine=engine)
+    outputs = {"campaign_data": build_report(campaign_data, metacards)}
+    outputs.update({name: frame for name, frame in metacards.items() if name.startswith("geo_acq_")})
+    return time.perf_counter() - start, outputs
+
+
+def check_header_only(paths, campaigns):
+    # Runs first, so nothing has been parsed in this process yet
+    for source, path in paths.items():
+        header_only = path + ".header"
+        with open(path) as f, open(header_only, "w") as out:
+            out.write(f.readline())
+        expected = ingest_source(source, header_only, campaigns, engine="pandas")
+        actual = ingest_source(source, header_only, campaigns, engine="duckdb")
+        for frame, other in zip(expected, actual):
+            assert len(frame) == 0, source
+            pd.testing.assert_frame_equal(frame, other)
+
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    with tempfile.TemporaryDirectory() as out_dir:
+        paths = make_metacards(out_dir, rows)
+        check_header_only(paths, build_campaigns(make_mapping_ref()))
+        campaign_data = make_campaign_data(150, 90)
+        campaigns = build_campaigns(make_mapping_ref())
+        pandas_seconds, expected = run_engine(paths, campaign_data, campaigns, "pandas")
+        duckdb_seconds, actual = run_engine(paths, campaign_data, campaigns, "duckdb")
+        _, folded = run_engine(paths, campaign_data, campaigns, "pandas", rows // (COMBINE_EVERY * 5) + 1)
+
+    for name, frame in expected.items():
+        pd.testing.assert_frame_equal(frame, actual[name], check_exact=True)
+        pd.testing.assert_frame_equal(frame, folded[name], check_exact=True)
+        print(f"{name + ':':<17} {len(frame):,} rows identical")
+    print(f"rows per card:   {rows:,}")
+    print(f"pandas:          {pandas_seconds:.3f}s")
+    print(f"duckdb:          {duckdb_seconds:.3f}s")
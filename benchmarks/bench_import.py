@@ -0,0 +1,117 @@
+# Import-time regression check for the app's cold start. Imports what b_cities_geo.py imports at module level
+# in fresh interpreters under -X importtime: the modules before the page shell (st.title) and all of them.
+# Fails if a heavy client library is imported at module level, or if either median goes over its budget or
+# over a baseline report by more than the tolerance.
+#   python benchmarks/bench_import.py [--runs 5] [--out report.json] [--compare baseline.json]
+import argparse
+import ast
+import json
+import os
+import statistics
+import subprocess
+import sys
+from datetime import datetime, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+APP_PATH = os.path.join(REPO_DIR, "b_cities_geo.py")
+
+# Only ever imported inside the functions that need them
+LAZY_MODULES = ["google.ads", "gspread", "oauth2client", "google.oauth2", "chardet", "yaml", "duckdb"]
+
+# Median import time in ms; generous, so only a real regression (a heavy module imported eagerly) trips them
+SHELL_BUDGET_MS = 1000
+FULL_BUDGET_MS = 2500
+TOLERANCE = 1.25
+
+
+def app_imports(path=APP_PATH):
+    # Module-level import statements of the app, split at the first st.title call
+    with open(path) as f:
+        tree = ast.parse(f.read())
+    shell, rest, seen_title = [], [], False
+    for node in tree.body:
+        if isinstance(node, ast.Expr) and "st.title(" in ast.unparse(node):
+            seen_title = True
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            (rest if seen_title else shell).append(ast.unparse(node))
+    if not seen_title:
+        raise SystemExit(f"no st.title call in {path}")
+    return shell, shell + rest
+
+
+def measure(statements):
+    # Wall time of the imports (sum of -X importtime self times) and the modules they loaded
+    code = "\n".join(statements + ["import json, sys", "print(json.dumps(sorted(sys.modules)))"])
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=REPO_DIR,
+                            capture_output=True, text=True, check=True)
+    total_us, top = 0, []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        total_us += int(self_us)
+        # Nested imports are indented under the module that imported them
+        if not name[1:].startswith(" "):
+            top.append((int(cumulative_us), name.strip()))
+    return total_us / 1000, sorted(top, reverse=True), json.loads(result.stdout)
+
+
+def check(name, statements, runs, budget_ms):
+    timings = []
+    for _ in range(runs + 1):
+        ms, top, modules = measure(statements)
+        timings.append(ms)
+    # The first run only warms the filesystem cache
+    median_ms = statistics.median(timings[1:])
+    eager = sorted({lazy for lazy in LAZY_MODULES for module in modules if module == lazy or module.startswith(lazy + ".")})
+    print(f"{name}: {median_ms:.0f} ms median of {runs} (budget {budget_ms} ms), {len(modules)} modules")
+    for cumulative_us, module in top[:8]:
+        print(f"  {module:<32} {cumulative_us / 1000:8.1f} ms")
+    return {"median_ms": round(median_ms, 1), "budget_ms": budget_ms, "modules": len(modules), "eager": eager}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Check the app's import-time cost.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--out", help="JSON report")
+    parser.add_argument("--compare", help="earlier JSON report; fail if slower than it by more than --tolerance")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    shell, full = app_imports()
+    report = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "shell": check("shell", shell, args.runs, SHELL_BUDGET_MS),
+        "full": check("full", full, args.runs, FULL_BUDGET_MS),
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+    failures = []
+    for name in ("shell", "full"):
+        result = report[name]
+        if result["eager"]:
+            failures.append(f"{name} imports {', '.join(result['eager'])} at module level")
+        if result["median_ms"] > result["budget_ms"]:
+            failures.append(f"{name} imports take {result['median_ms']} ms, over the {result['budget_ms']} ms budget")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        for name in ("shell", "full"):
+            limit = baseline[name]["median_ms"] * args.tolerance
+            if report[name]["median_ms"] > limit:
+                failures.append(f"{name} imports take {report[name]['median_ms']} ms, over {limit:.0f} ms "
+                                f"({args.tolerance}x the baseline)")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
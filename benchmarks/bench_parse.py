@@ -0,0 +1,91 @@
+# Compare per-row regex parsing of UACE campaign labels with parsing each distinct label once. Also checks
+# that empty input (a day without spend, a header-only metacard) parses to an empty result of the usual shape,
+# whether or not anything was parsed before, and that Mapping_ref name joins ignore surrounding whitespace on
+# both sides while keeping the names as written.
+#   python benchmarks/bench_parse.py [rows]
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from b_cities.campaigns import (_parsed, _to_campaign_id, build_campaigns, match_campaigns, parse_campaign_id,
+                                parse_campaign_labels, strip_campaigns)
+from b_cities.ads import CUSTOMER_IDS, fetch_kw_data
+from b_cities.pipeline import map_costs
+from bench_aggregate import make_uace_rows
+from synthetic import START_DATE, FakeGoogleAdsClient, make_mapping_ref
+
+
+def per_row(names):
+    return pd.DataFrame({
+        "Campaign": names.str.extract(r'^(.*?)(?=\()', expand=False).str.strip(),
+        "campaign_id": _to_campaign_id(names.str.extract(r'\((\d+)\)$', expand=False)),
+    })
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def check_empty(names):
+    # Cold (no table for the dtype yet) and warm empty results match a non-empty result's columns and dtypes
+    for parse in (parse_campaign_id, strip_campaigns, parse_campaign_labels):
+        for dtype in ("object", "category"):
+            _parsed.clear()
+            empty = names.iloc[:0].astype(dtype)
+            cold = parse(empty)
+            full = parse(names.iloc[:100].astype(dtype))
+            assert len(cold) == 0 and cold.index.equals(empty.index), parse.__name__
+            if isinstance(full, pd.DataFrame):
+                pd.testing.assert_series_equal(cold.dtypes, full.dtypes)
+            else:
+                assert cold.dtype == full.dtype, (parse.__name__, cold.dtype, full.dtype)
+            pd.testing.assert_index_equal(parse(empty).index, empty.index)
+
+    # Costs for a range without spend, mapped before anything else was parsed
+    _parsed.clear()
+    costs = fetch_kw_data(FakeGoogleAdsClient(empty_days=[START_DATE]), CUSTOMER_IDS, START_DATE.isoformat(),
+                          START_DATE.isoformat(), backoff=0)
+    assert len(map_costs(costs, build_campaigns(make_mapping_ref()))) == 0
+
+
+def check_matching(rows=10_000):
+    # Every fifth Mapping_ref name carries a trailing space; keys come raw, trimmed and padded
+    mapping_ref = make_mapping_ref()
+    mapping_ref["Campaign"] = [name + " " * (i % 5 == 0) for i, name in enumerate(mapping_ref["Campaign"])]
+    campaigns = build_campaigns(mapping_ref)
+    pd.testing.assert_series_equal(campaigns["frame"]["Campaign"], mapping_ref["Campaign"])
+
+    names = pd.Series(list(mapping_ref["Campaign"]) + ["Unmapped"], dtype=object)
+    picked = names.sample(rows, replace=True, random_state=0).reset_index(drop=True)
+    keys = pd.Series([[name, name.strip(), f" {name.strip()}  "][i % 3] for i, name in enumerate(picked)])
+    matched_rows, matches = match_campaigns(keys, campaigns)
+    expected = pd.DataFrame({"name": keys.str.strip()}).reset_index().merge(
+        pd.DataFrame({"name": mapping_ref["Campaign"].str.strip()}).reset_index(), on="name", sort=False)
+    assert list(matched_rows) == list(expected["index_x"]), "rows"
+    assert list(matches) == list(expected["index_y"]), "matches"
+    assert len(matched_rows) == (picked != "Unmapped").sum()
+
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000
+    names = make_uace_rows(rows)["CAMPAIGN_NAME"]
+    check_empty(names)
+    check_matching()
+
+    per_row_seconds, expected = timed(lambda: per_row(names))
+    _parsed.clear()
+    cold_seconds, cold = timed(lambda: parse_campaign_labels(names))
+    warm_seconds, warm = timed(lambda: parse_campaign_labels(names))
+    pd.testing.assert_frame_equal(expected, cold)
+    pd.testing.assert_frame_equal(expected, warm)
+
+    print(f"rows:             {rows:,}")
+    print(f"per row:          {per_row_seconds:.3f}s")
+    print(f"distinct (cold):  {cold_seconds:.3f}s")
+    print(f"distinct (warm):  {warm_seconds:.3f}s")
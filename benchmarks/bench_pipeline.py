@@ -0,0 +1,191 @@
+# Time every pipeline stage on synthetic data at several sizes and record peak RSS, fully offline.
+#   python benchmarks/bench_pipeline.py [--sizes 10000 1000000 10000000] [--engine pandas|duckdb]
+#                                       [--out report.json] [--compare baseline.json]
+# Each size runs in a fresh interpreter so memory figures do not bleed between sizes.
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+from b_cities.perf import rss_bytes
+
+SIZES = [10_000, 1_000_000, 10_000_000]
+DATA_DIR = os.path.join(REPO_DIR, ".cache", "bench")
+CAMPAIGNS = 150
+DAYS = 90
+
+
+class PeakRss:
+    # Samples resident memory in the background, so each stage gets its own peak
+    INTERVAL_SECONDS = 0.005
+
+    def __init__(self):
+        self.peak = self.current()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+
+    def current(self):
+        return rss_bytes()
+
+    def _sample(self):
+        while not self._stop.wait(self.INTERVAL_SECONDS):
+            self.peak = max(self.peak, self.current())
+
+    def reset(self):
+        self.peak = self.current()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+@contextmanager
+def stage(results, name, rss):
+    rss.reset()
+    start = time.perf_counter()
+    yield
+    seconds = time.perf_counter() - start
+    rss.peak = max(rss.peak, rss.current())
+    results[name] = {"seconds": round(seconds, 4), "peak_rss_mb": round(rss.peak / 2**20, 1)}
+    print(f"  {name:<22} {seconds:9.3f}s {rss.peak / 2**20:9.1f} MB", file=sys.stderr)
+
+
+def run_size(rows, engine, seed, data_dir):
+    from b_cities.memo import file_digest
+    from b_cities.pipeline import (MAPPING_WORKSHEET, SHEET_ID, build_report, collect_metacards, fetch_costs,
+                                   ingest_source, load_mapping, map_costs, publish, report_outputs)
+    from b_cities.sheets import SheetsSession
+    from synthetic import START_DATE, FakeGoogleAdsClient, FakeGspreadClient, make_mapping_ref, make_metacards
+
+    generate_start = time.perf_counter()
+    paths = make_metacards(data_dir, rows, CAMPAIGNS, DAYS, seed, reuse=True)
+    generate_seconds = time.perf_counter() - generate_start
+
+    # The pipeline keeps its caches under .cache relative to the working directory; start from none
+    os.chdir(tempfile.mkdtemp(prefix="bench_pipeline_"))
+    ads = FakeGoogleAdsClient(CAMPAIGNS, seed=seed)
+    sheets = FakeGspreadClient()
+    sheets.load(SHEET_ID, MAPPING_WORKSHEET, make_mapping_ref(CAMPAIGNS, seed))
+    session = SheetsSession(sheets)
+    start_date = START_DATE.isoformat()
+    end_date = (START_DATE + timedelta(days=DAYS - 1)).isoformat()
+
+    rss = PeakRss()
+    results = {}
+    with stage(results, "fetch_costs", rss):
+        costs = fetch_costs(ads, start_date, end_date)
+    with stage(results, "fetch_costs_cached", rss):
+        costs = fetch_costs(ads, start_date, end_date)
+    with stage(results, "load_mapping", rss):
+        campaigns = load_mapping(lambda: session)
+    with stage(results, "map_costs", rss):
+        campaign_data = map_costs(costs, campaigns)
+    with stage(results, "file_digest", rss):
+        for path in paths.values():
+            file_digest(path, {})
+    ingested = {}
+    for source, path in paths.items():
+        with stage(results, f"ingest_{source}", rss):
+            ingested[source] = ingest_source(source, path, campaigns, engine=engine)
+    metacards = collect_metacards(ingested)
+    with stage(results, "build_report", rss):
+        campaign_data = build_report(campaign_data, metacards)
+    outputs = report_outputs(campaign_data, metacards)
+    with stage(results, "publish", rss):
+        publish(session, outputs)
+    with stage(results, "publish_unchanged", rss):
+        publish(session, outputs)
+    rss.stop()
+
+    return {
+        "stages": results,
+        "output_rows": {name: len(frame) for name, frame in outputs.items()},
+        "generate_seconds": round(generate_seconds, 2),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (2**20 if sys.platform == "darwin" else 2**10), 1),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline):
+    # Per-stage time and memory ratios against an earlier report; < 1 is an improvement
+    print(f"\nvs {baseline.get('commit') or 'baseline'} ({baseline['created']})")
+    for size, result in report["sizes"].items():
+        before = baseline["sizes"].get(size)
+        if before is None:
+            continue
+        print(f"{int(size):,} rows")
+        for name, now in result["stages"].items():
+            then = before["stages"].get(name)
+            if then:
+                print(f"  {name:<22} time x{now['seconds'] / max(then['seconds'], 1e-9):6.2f}"
+                      f"   rss x{now['peak_rss_mb'] / max(then['peak_rss_mb'], 1e-9):6.2f}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline on synthetic data.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="metacard rows per card")
+    parser.add_argument("--engine", default="pandas", help="metacard engine, see metacards.ENGINES")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", default=DATA_DIR, help="generated CSVs are kept here and reused")
+    parser.add_argument("--out", default="bench_pipeline.json", help="JSON report")
+    parser.add_argument("--compare", help="earlier JSON report to compare against")
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.worker:
+        print(json.dumps(run_size(args.worker, args.engine, args.seed, os.path.abspath(args.data_dir))))
+        return 0
+
+    report = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "engine": args.engine,
+        "seed": args.seed,
+        "sizes": {},
+    }
+    for rows in args.sizes:
+        print(f"{rows:,} rows", file=sys.stderr)
+        worker = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--worker", str(rows), "--engine", args.engine,
+             "--seed", str(args.seed), "--data-dir", os.path.abspath(args.data_dir)],
+            stdout=subprocess.PIPE, check=True, text=True,
+        )
+        report["sizes"][str(rows)] = json.loads(worker.stdout)
+
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"report -> {args.out}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+# Time publishing the four output worksheets one at a time and concurrently, against a fake Sheets API
+# with per-request latency and 429 rate limiting, and check both leave the sheets with the same contents.
+# Also checks that a write from another process (or the CLI) in between is not diffed against, that two
+# sessions publishing at the same moment leave every sheet whole, and that republishing unchanged outputs
+# sends no rows however many worksheets are written at once.
+#   python benchmarks/bench_publish.py [rows] [latency_seconds] [rate_limit_every]
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from b_cities.campaigns import build_campaigns
+from b_cities.pipeline import OUTPUT_SHEETS, SHEET_ID, build_report, ingest_metacards, publish, report_outputs
+from b_cities.sheets import BATCH_CELLS, SheetsSession, frame_to_rows
+from bench_engines import make_campaign_data
+from synthetic import FakeGspreadClient, make_mapping_ref, make_metacards
+
+
+def make_outputs(rows):
+    with tempfile.TemporaryDirectory() as out_dir:
+        paths = make_metacards(out_dir, rows)
+        metacards = ingest_metacards(paths["2w_spot"], paths["uac"], paths["uace"], build_campaigns(make_mapping_ref()))
+    return report_outputs(build_report(make_campaign_data(150, 90), metacards), metacards)
+
+
+def run(outputs, max_workers, latency, rate_limit_every):
+    client = FakeGspreadClient(latency=latency, rate_limit_every=rate_limit_every)
+    # Short backoff so the run measures the fake's latency, not the real API's retry schedule
+    session = SheetsSession(client, backoff=0.01)
+    start = time.perf_counter()
+    statuses = publish(session, outputs, max_workers=max_workers)
+    seconds = time.perf_counter() - start
+    failed = [status["error"] for status in statuses.values() if status["status"] != "ok"]
+    assert not failed, failed
+    return seconds, client.open_by_key(SHEET_ID)
+
+
+def check_other_writers():
+    # The app writes, the CLI (its own session) overwrites with a longer table, and the app writes again:
+    # the app must not diff against what it wrote first
+    client = FakeGspreadClient()
+    app, cli = SheetsSession(client, backoff=0), SheetsSession(client, backoff=0)
+    worksheet = client.open_by_key(SHEET_ID).worksheet("Trial")
+    for session, values in [(app, [1, 2, 3]), (cli, [9, 9, 9, 9]), (app, [1, 2, 4])]:
+        session.write(SHEET_ID, "Trial", pd.DataFrame({"value": values}), "A:A")
+    assert worksheet.rows == [["value"], [1], [2], [4]], worksheet.rows
+
+    # Unchanged since the app's own write, so only the changed row is sent
+    assert app.write(SHEET_ID, "Trial", pd.DataFrame({"value": [1, 2, 5]}), "A:A") == 1
+
+    # Two Streamlit sessions share the one cached SheetsSession; publishing to one worksheet at once takes turns
+    frames = [pd.DataFrame({"value": list(range(i, i + 50))}) for i in range(8)]
+    with ThreadPoolExecutor(max_workers=len(frames)) as pool:
+        list(pool.map(lambda frame: app.write(SHEET_ID, "Trial", frame, "A:A"), frames))
+    assert worksheet.rows in [frame_to_rows(frame) for frame in frames], "mixed concurrent writes"
+
+
+def check_republish(outputs):
+    # The worksheets share one spreadsheet modified time; writing them concurrently must not make each
+    # other's snapshots look stale
+    for max_workers in (1, len(OUTPUT_SHEETS)):
+        session = SheetsSession(FakeGspreadClient(latency=0), backoff=0)
+        publish(session, outputs, max_workers=max_workers)
+        for republish in range(3):
+            statuses = publish(session, outputs, max_workers=max_workers)
+            changed = {status["worksheet"]: status["changed_rows"] for status in statuses.values()}
+            assert set(changed.values()) == {0}, (max_workers, republish, changed)
+
+
+if __name__ == "__main__":
+    check_other_writers()
+
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.25
+    rate_limit_every = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+    outputs = make_outputs(rows)
+    check_republish(outputs)
+
+    sequential_seconds, expected = run(outputs, 1, latency, rate_limit_every)
+    concurrent_seconds, actual = run(outputs, len(OUTPUT_SHEETS), latency, rate_limit_every)
+
+    for name, (worksheet_title, _) in OUTPUT_SHEETS.items():
+        written = actual.worksheet(worksheet_title).rows
+        assert written == expected.worksheet(worksheet_title).rows == frame_to_rows(outputs[name]), name
+        print(f"{worksheet_title + ':':<17} {len(written) - 1:,} rows identical")
+    print(f"requests:        {actual.requests} ({actual.rate_limited} rate limited, {BATCH_CELLS:,} cells each at most)")
+    print(f"sequential:      {sequential_seconds:.3f}s")
+    print(f"concurrent:      {concurrent_seconds:.3f}s")
@@ -0,0 +1,222 @@
+# Seeded synthetic inputs for the benchmarks: the three metacard CSVs, Mapping_ref, and offline stand-ins
+# for the Google Ads and gspread clients. Everything here is deterministic for a given seed.
+import os
+import re
+import threading
+import time
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+START_DATE = date(2024, 1, 1)
+
+
+def campaign_table(campaigns):
+    # IDs and names shared by every generator; every third campaign is a UAC_ROI_tCPA one
+    ids = np.arange(10_000_000, 10_000_000 + campaigns)
+    names = np.array([f"Campaign_{i}" + ("_UAC_ROI_tCPA" if i % 3 == 0 else "") for i in range(campaigns)], dtype=object)
+    return ids, names
+
+
+def with_missing(rng, values, share=0.05):
+    values = pd.Series(values)
+    return values.where(rng.random(len(values)) >= share)
+
+
+def make_mapping_ref(campaigns=150, seed=0):
+    rng = np.random.default_rng(seed)
+    ids, names = campaign_table(campaigns)
+    return pd.DataFrame({
+        "Campaign ID": ids.astype(str),
+        "Campaign": names,
+        "City": rng.choice(["Pune", "Jaipur", "Kochi", "Nagpur"], campaigns),
+        "Category": rng.choice(["2W", "Trucks"], campaigns),
+    })
+
+
+def make_metacards(out_dir, rows, campaigns=150, days=90, seed=0, reuse=False):
+    # Real column names plus missing values, unknown codes, unparseable labels and unmapped campaigns.
+    # Returns {source: path}, with sources named as in METACARD_SPECS; reuse keeps files already generated.
+    os.makedirs(out_dir, exist_ok=True)
+    name = f"{rows}_{campaigns}_{days}_{seed}"
+    paths = {source: os.path.join(out_dir, f"{source}_{name}.csv") for source in ("2w_spot", "uace", "uac")}
+    if reuse and all(os.path.exists(path) for path in paths.values()):
+        return paths
+
+    rng = np.random.default_rng(seed)
+    ids, names = campaign_table(campaigns)
+    labels = np.array([f"{name} ({campaign_id})" for name, campaign_id in zip(names, ids)], dtype=object)
+    dates = pd.date_range(START_DATE, periods=days).strftime("%d-%m-%Y").to_numpy(dtype=object)
+
+    picked = rng.integers(0, campaigns, rows)
+    pd.DataFrame({
+        "UTM_CAMPAIGN": ids[picked],
+        "LEAD_DATE": dates[rng.integers(0, days, rows)],
+        "CAMPAIGN_NAME": names[picked],
+        "CUSTOMER": rng.integers(0, 2, rows),
+        "FREQUENCY_ENUM": with_missing(rng, rng.integers(1, 7, rows)),
+        "FIRST_CATEGORY": with_missing(rng, rng.choice(["2w", "LCV", "HCV", "Bus"], rows)),
+        "REG_GEO_ID": with_missing(rng, rng.integers(1, 35, rows)),
+        "ACQ_2W": rng.integers(0, 2, rows),
+        "ACQ_TRUCKS": rng.integers(0, 2, rows),
+        "ACQ_HCV": with_missing(rng, rng.integers(0, 2, rows)),
+        "ACQ_LCV": rng.integers(0, 2, rows),
+        "PNM_CONV": rng.integers(0, 2, rows),
+    }).to_csv(paths["2w_spot"], index=False)
+
+    pd.DataFrame({
+        "CUSTOMER_ID": rng.integers(0, 10**6, rows),
+        "VEHICLE_ID": with_missing(rng, rng.choice([97, 126, 1, 9, 133, 0, 55], rows)),
+        "FREQ": with_missing(rng, rng.integers(1, 7, rows)),
+        "GEO_REGION_ID": with_missing(rng, rng.integers(1, 35, rows)),
+        "CAMPAIGN_NAME": with_missing(rng, labels[rng.integers(0, campaigns, rows)]),
+        "ORDER_DATE": dates[rng.integers(0, days, rows)],
+    }).to_csv(paths["uace"], index=False)
+
+    unmapped = np.append(names, ["Unmapped"])
+    pd.DataFrame({
+        "MOBILE_NUMBER": rng.integers(0, 10**9, rows),
+        "VEHICLE_TYPE": with_missing(rng, rng.choice(["2W", "LCV", "HCV", "Bus"], rows)),
+        "FREQ": with_missing(rng, rng.integers(1, 7, rows)),
+        "GEO_REGION_ID": with_missing(rng, rng.integers(1, 35, rows)),
+        "CAMPAIGN_NAME": unmapped[np.minimum(rng.integers(0, campaigns + 10, rows), campaigns)],
+        "REG_DATE_FORMATED": dates[rng.integers(0, days, rows)],
+    }).to_csv(paths["uac"], index=False)
+    return paths
+
+
+class FakeGoogleAdsService:
+    # Answers search_stream like the real service: batches of rows for every campaign and day in the query.
+    # A day's costs depend only on the seed, account and day, so any split of a range returns the same rows;
+    # empty_days get no rows at all. queries records (customer_id, start, end) of every call; failures maps
+    # (customer_id, start) to exceptions raised by the next calls for that shard, one per call. latency is
+    # slept once per call, before the first batch, like the round trip of a real query.
+    def __init__(self, campaigns, batch_size, seed, empty_days=(), latency=0.0):
+        self.ids, self.names = campaign_table(campaigns)
+        self.batch_size = batch_size
+        self.seed = seed
+        self.empty_days = set(empty_days)
+        self.latency = latency
+        self.calls = 0
+        self.queries = []
+        self.failures = {}
+
+    def search_stream(self, customer_id, query):
+        self.calls += 1
+        start, end = (date.fromisoformat(day) for day in re.findall(r"'(\d{4}-\d{2}-\d{2})'", query))
+        self.queries.append((customer_id, start, end))
+        time.sleep(self.latency)
+        if self.failures.get((customer_id, start)):
+            raise self.failures[(customer_id, start)].pop(0)
+        days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+        days = [day.isoformat() for day in days if day not in self.empty_days]
+        cost_micros = np.concatenate([
+            np.random.default_rng([self.seed, int(customer_id), date.fromisoformat(day).toordinal()])
+            .integers(0, 50_000_000, len(self.ids))
+            for day in days
+        ] or [np.array([], dtype=np.int64)])
+        rows = [
+            SimpleNamespace(
+                segments=SimpleNamespace(date=day),
+                # Ads names carry stray whitespace that map_costs strips
+                campaign=SimpleNamespace(name=name + " " * (i % 2), id=int(campaign_id)),
+                metrics=SimpleNamespace(cost_micros=int(cost_micros[d * len(self.ids) + i])),
+            )
+            for d, day in enumerate(days)
+            for i, (campaign_id, name) in enumerate(zip(self.ids, self.names))
+        ]
+        for i in range(0, len(rows), self.batch_size):
+            yield SimpleNamespace(results=rows[i:i + self.batch_size])
+
+
+class FakeGoogleAdsClient:
+    def __init__(self, campaigns=150, batch_size=10_000, seed=0, empty_days=(), latency=0.0):
+        self.service = FakeGoogleAdsService(campaigns, batch_size, seed, empty_days, latency)
+
+    def get_service(self, name, version=None):
+        return self.service
+
+
+class FakeWorksheet:
+    # touch is called on every change, so the spreadsheet's modified time moves like the real one
+    def __init__(self, title, touch=lambda: None):
+        self.title = title
+        self.rows = []
+        self.touch = touch
+
+    def get_all_values(self):
+        return [list(row) for row in self.rows]
+
+    def batch_clear(self, ranges):
+        self.rows = []
+        self.touch()
+
+    def put(self, first_row, values):
+        end = first_row + len(values)
+        if len(self.rows) < end:
+            self.rows.extend([] for _ in range(end - len(self.rows)))
+        self.rows[first_row:end] = values
+        self.touch()
+
+
+class FakeRateLimitError(Exception):
+    # Shaped like gspread's APIError: the HTTP response rides along on .response
+    def __init__(self, retry_after):
+        super().__init__("429: Quota exceeded for quota metric 'Write requests'")
+        self.response = SimpleNamespace(status_code=429, headers={"Retry-After": str(retry_after)})
+
+
+class FakeSpreadsheet:
+    # latency is added to every write call; every rate_limit_every-th write is refused with a 429
+    def __init__(self, latency=0.0, rate_limit_every=0, retry_after=0.05):
+        self.worksheets = {}
+        self.requests = 0
+        self.rate_limited = 0
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.updates = 0
+        self._lock = threading.Lock()
+
+    def worksheet(self, title):
+        return self.worksheets.setdefault(title, FakeWorksheet(title, self.touch))
+
+    def touch(self):
+        with self._lock:
+            self.updates += 1
+
+    def get_lastUpdateTime(self):
+        # One millisecond later per change
+        return (pd.Timestamp("2024-01-01") + pd.Timedelta(milliseconds=self.updates)).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+    def values_batch_update(self, body):
+        time.sleep(self.latency)
+        with self._lock:
+            self.requests += 1
+            refused = self.rate_limit_every and self.requests % self.rate_limit_every == 0
+            self.rate_limited += bool(refused)
+        if refused:
+            raise FakeRateLimitError(self.retry_after)
+        for item in body["data"]:
+            title, row = re.match(r"'(.*)'!A(\d+)$", item["range"]).groups()
+            self.worksheet(title.replace("''", "'")).put(int(row) - 1, item["values"])
+
+
+class FakeGspreadClient:
+    # Only the calls SheetsSession makes; spreadsheets are created on first open with the given
+    # latency and rate limiting (see FakeSpreadsheet)
+    def __init__(self, **spreadsheet_options):
+        self.spreadsheets = {}
+        self.spreadsheet_options = spreadsheet_options
+
+    def open_by_key(self, key):
+        if key not in self.spreadsheets:
+            self.spreadsheets[key] = FakeSpreadsheet(**self.spreadsheet_options)
+        return self.spreadsheets[key]
+
+    def load(self, key, title, frame):
+        worksheet = self.open_by_key(key).worksheet(title)
+        worksheet.rows = [list(frame.columns)] + frame.astype(str).values.tolist()
+        worksheet.touch()